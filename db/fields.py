@@ -1,5 +1,9 @@
+from decimal import Decimal, ROUND_HALF_EVEN
 from django.db import models
 
+# Binance gives prices and quantities with 8 digits after the point
+DEFAULT_SCALE = 8
+
 
 class EnumField(models.Field):
     """
@@ -7,3 +11,75 @@ class EnumField(models.Field):
     """
     def db_type(self, connection):
         return "enum({0})".format(','.join("'%s'" % v[0] for v in self.choices))
+
+
+def to_decimal(value) -> Decimal | None:
+    if value is None or isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        # Shortest representation of float, so 0.1 is Decimal('0.1'), not binary approximation of it
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def to_units(value, scale: int = DEFAULT_SCALE) -> int | None:
+    """
+    Number as integer count of 10 ** -scale, rounded half to even
+    """
+    if value is None:
+        return None
+    return int(to_decimal(value).scaleb(scale).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+def from_units(units: int | None, scale: int = DEFAULT_SCALE) -> Decimal | None:
+    if units is None:
+        return None
+    return Decimal(units).scaleb(-scale)
+
+
+def to_units_array(values, scale: int = DEFAULT_SCALE):
+    """
+    to_units() of all values of array by one call, returns numpy array of int64.
+    Floats are rounded to the nearest unit, it is exact while values * 10 ** scale < 2 ** 53.
+    """
+    import numpy
+    return numpy.rint(numpy.asarray(values, dtype=numpy.float64) * 10 ** scale).astype(numpy.int64)
+
+
+def from_units_array(units, scale: int = DEFAULT_SCALE):
+    """
+    Array of units as numpy array of the nearest floats
+    """
+    import numpy
+    return numpy.asarray(units, dtype=numpy.int64) / 10 ** scale
+
+
+class FixedPointField(models.Field):
+    """
+    Decimal number with fixed scale, stored in MySQL's BIGINT as integer count of 10 ** -scale.
+    Values are Decimal, floats are converted by their shortest representation and rounded to the scale.
+    """
+    def __init__(self, *args, scale: int = DEFAULT_SCALE, **kwargs):
+        self.scale = scale
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.scale != DEFAULT_SCALE:
+            kwargs['scale'] = self.scale
+        return name, path, args, kwargs
+
+    def db_type(self, connection):
+        return "bigint"
+
+    # noinspection PyUnusedLocal
+    def from_db_value(self, value, expression, connection):
+        return from_units(value, scale=self.scale)
+
+    def to_python(self, value):
+        if value is None:
+            return None
+        return from_units(to_units(value, scale=self.scale), scale=self.scale)
+
+    def get_prep_value(self, value):
+        return to_units(super().get_prep_value(value), scale=self.scale)
@@ -1,52 +1,206 @@
 from django.core.cache import cache
-import json
-import hashlib
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+import functools
+import re
+import threading
+import time
+import zlib
 
 
-def _make_key(args, kwargs, typed,
-              fast_types=None,
-              _tuple=tuple, _type=type, _len=len):
-    """Make a cache key from optionally typed positional and keyword arguments
+# Longer keys and keys with characters, not allowed by memcached, are hashed
+_KEY_MAX_LENGTH = 200
+_key_unsafe_re = re.compile(r'[\x00-\x20\x7f]')
+
+
+_primitive_types = frozenset((int, float, str, bytes, bool, type(None)))
+
 
-    The key is constructed in a way that is flat as possible rather than
-    as a nested structure that would take more memory.
+def _key_part(value) -> str:
+    if type(value) in _primitive_types:
+        return repr(value)
+    if isinstance(value, Enum):
+        value = value.value
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return repr(value)
+    if isinstance(value, Decimal):
+        return 'D' + str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, '_meta') and hasattr(value, 'pk'):
+        # Django model instance
+        return value._meta.label + '#' + repr(value.pk)
+    if isinstance(value, tuple):
+        return '(' + ','.join(map(_key_part, value)) + ')'
+    if isinstance(value, list):
+        return '[' + ','.join(map(_key_part, value)) + ']'
+    if isinstance(value, dict):
+        return '{' + ','.join(_key_part(k) + ':' + _key_part(v) for k, v in value.items()) + '}'
+    raise TypeError('Unsupported type of cache key argument: ' + type(value).__name__)
 
-    If there is only a single argument and its data type is known to cache
-    its hash value, then that argument is returned without a wrapper. These
-    saves space and improves lookup speed.
 
+def _make_key(args, kwargs, typed) -> str:
+    """Make a cache key from optionally typed positional and keyword arguments
+
+    Primitives, Decimals, dates, enums and model instances (by label and pk), and tuples, lists and dicts of them
+    are supported. Short keys are readable, the others are hashed by CRC32 and Adler-32.
+
+    f(x=1, y=2) and f(y=2, x=1) are cached separately.
     """
-    # All code below relies on kwargs preserving the order input by the user.
-    # Formerly, we sorted() the kwargs before looping.  The new way is *much*
-    # faster; however, it means that f(x=1, y=2) will now be treated as a
-    # distinct call from f(y=2, x=1) which will be cached separately.
-    if fast_types is None:
-        fast_types = {int, str}
-    key = args
+    if len(args) == 1 and not kwargs and not typed:
+        # Fast path of the most common case
+        _type = type(args[0])
+        if _type is int:
+            return str(args[0])
+        if _type is str and len(args[0]) < _KEY_MAX_LENGTH and _key_unsafe_re.search(args[0]) is None:
+            return repr(args[0])
+    parts = list(map(_key_part, args))
     if kwargs:
-        for item in kwargs.items():
-            key += item
+        parts += [k + '=' + _key_part(v) for k, v in kwargs.items()]
     if typed:
-        key += _tuple(_type(v) for v in args)
+        parts += [type(v).__name__ for v in args]
         if kwargs:
-            key += _tuple(_type(v) for v in kwargs.values())
-    elif _len(key) == 1 and _type(key[0]) in fast_types:
-        return key[0]
-    # return json.dumps(key)
-    return hashlib.md5(json.dumps(key).encode()).hexdigest()
+            parts += [type(v).__name__ for v in kwargs.values()]
+    key = ','.join(parts)
+    if len(key) > _KEY_MAX_LENGTH or _key_unsafe_re.search(key) is not None:
+        data = key.encode()
+        return '%08x%08x%x' % (zlib.crc32(data), zlib.adler32(data), len(data))
+    return key
+
+
+class _LocalCache:
+    """
+    Per-process LRU tier of cached()
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key, _MISSING)
+            if item is _MISSING:
+                return _MISSING
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._items[key]
+                return _MISSING
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float | None):
+        with self._lock:
+            self._items[key] = (value, None if ttl is None else time.monotonic() + ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
 
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_MISSING = object()
+
+
+def cached(key: str, ttl: int = 0, typed=False, local_size: int = 128, local_ttl: float | None = None):
+    """
+    Memoizes results of function in per-process LRU tier and in Django cache (shared by processes).
+
+    None results are cached too. Concurrent calls with the same arguments in one process call function once.
+    Decorated function has methods:
+        invalidate(*args, **kwargs) - removes result for the arguments from both tiers
+        cache_clear() - clears per-process tier
+        stats() - hit and miss counters
+
+    :param key: Prefix of keys
+    :param ttl: Seconds to keep result in Django cache, 0 - forever
+    :param local_size: Max number of results in per-process tier, 0 - tier is disabled
+    :param local_ttl: Seconds to keep result in per-process tier, ttl by default.
+        Invalidation in other processes doesn't affect this tier, so it should be short for values, that are changed
+    """
+    if local_ttl is None and ttl != 0:
+        local_ttl = ttl
+    local = _LocalCache(size=local_size) if local_size > 0 else None
+    locks = {}
+    # Guards locks and counters, which are changed by many threads
+    locks_lock = threading.Lock()
+    counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def count(name: str):
+        with locks_lock:
+            counters[name] += 1
 
-def cached(key: str, ttl: int = 0, typed=False):
     def __wrapper_func(_func):
+        def _key(args, kwargs):
+            return key + ':' + _make_key(args, kwargs, typed)
+
+        def _get(full_key):
+            if local is not None:
+                value = local.get(full_key)
+                if value is not _MISSING:
+                    count('local_hits')
+                    return value
+            # Result is wrapped in a tuple, so cached None is distinguished from miss
+            item = cache.get(full_key)
+            if item is not None:
+                count('shared_hits')
+                if local is not None:
+                    local.set(full_key, item[0], local_ttl)
+                return item[0]
+            return _MISSING
+
+        @functools.wraps(_func)
         def _wrapper(*args, **kwargs):
-            nonlocal key
-            key = key + _make_key(args, kwargs, typed)
-            result = cache.get(key)
-            if result is None:
-                result = _func(*args, **kwargs)
-                cache.set(key, result, None if ttl == 0 else ttl)
-            return result
+            full_key = _key(args, kwargs)
+            result = _get(full_key)
+            if result is not _MISSING:
+                return result
+
+            with locks_lock:
+                lock = locks.setdefault(full_key, threading.Lock())
+            try:
+                with lock:
+                    # Could be computed by other thread, while this one was waiting for the lock
+                    result = _get(full_key)
+                    if result is not _MISSING:
+                        return result
+                    count('misses')
+                    result = _func(*args, **kwargs)
+                    cache.set(full_key, (result,), None if ttl == 0 else ttl)
+                    if local is not None:
+                        local.set(full_key, result, local_ttl)
+                    return result
+            finally:
+                with locks_lock:
+                    if locks.get(full_key) is lock and not lock.locked():
+                        del locks[full_key]
+
+        def invalidate(*args, **kwargs):
+            full_key = _key(args, kwargs)
+            if local is not None:
+                local.delete(full_key)
+            cache.delete(full_key)
+
+        def cache_clear():
+            if local is not None:
+                local.clear()
+
+        def stats() -> dict:
+            with locks_lock:
+                return dict(counters)
 
+        _wrapper.invalidate = invalidate
+        _wrapper.cache_clear = cache_clear
+        _wrapper.stats = stats
         return _wrapper
 
     return __wrapper_func
@@ -0,0 +1,127 @@
+"""
+Codecs of messages, sent through RabbitMQ.
+
+'struct' codec encodes registered dataclasses by schema:
+    header: magic byte, codec version, schema id (uint16), schema version
+    null bitmap of fields
+    fixed size fields (int, float, bool) packed by one struct
+    str and bytes fields, each is prefixed by length (uint32)
+Objects of not registered classes are pickled. Decoder detects format by the first byte,
+so consumers read messages of both codecs.
+"""
+import pickle
+import struct
+from django.conf import settings
+
+MAGIC = 0xC5
+VERSION = 1
+PICKLE = 'pickle'
+STRUCT = 'struct'
+
+_header = struct.Struct('>BBHB')
+_length = struct.Struct('>I')
+_fixed_codes = {int: 'q', float: 'd', bool: '?'}
+_variable_types = (str, bytes)
+
+
+class CodecError(Exception):
+    pass
+
+
+class Schema:
+    def __init__(self, cls, schema_id: int, version: int, fields: list[tuple]):
+        """
+        :param cls: Dataclass (or any class, accepting fields as keyword arguments)
+        :param fields: List of (name, type), order of fields is the format of message
+        """
+        self.cls = cls
+        self.schema_id = schema_id
+        self.version = version
+        self.names = [name for name, _ in fields]
+        self.fixed = [name for name, _type in fields if _type in _fixed_codes]
+        self.variable = [(name, _type) for name, _type in fields if _type in _variable_types]
+        for name, _type in fields:
+            if _type not in _fixed_codes and _type not in _variable_types:
+                raise CodecError('Unsupported type of field ' + name + ': ' + str(_type))
+        self.defaults = {name: 0 if _type is not bool else False for name, _type in fields if _type in _fixed_codes}
+        self.bitmap_size = (len(fields) + 7) // 8
+        self.head = _header.pack(MAGIC, VERSION, schema_id, version)
+        self.fixed_struct = struct.Struct(
+            '>' + ''.join(_fixed_codes[_type] for _, _type in fields if _type in _fixed_codes)
+        )
+
+    def encode(self, obj) -> bytes:
+        bitmap = 0
+        values = []
+        for i, name in enumerate(self.names):
+            if getattr(obj, name) is None:
+                bitmap |= 1 << i
+        for name in self.fixed:
+            value = getattr(obj, name)
+            values.append(self.defaults[name] if value is None else value)
+        parts = [self.head, bitmap.to_bytes(self.bitmap_size, 'big'), self.fixed_struct.pack(*values)]
+        for name, _type in self.variable:
+            value = getattr(obj, name)
+            if value is None:
+                value = b''
+            elif _type is str:
+                value = value.encode()
+            parts.append(_length.pack(len(value)))
+            parts.append(value)
+        return b''.join(parts)
+
+    def decode(self, data: bytes, offset: int):
+        bitmap = int.from_bytes(data[offset:offset + self.bitmap_size], 'big')
+        offset += self.bitmap_size
+        kwargs = dict(zip(self.fixed, self.fixed_struct.unpack_from(data, offset)))
+        offset += self.fixed_struct.size
+        for name, _type in self.variable:
+            (length,) = _length.unpack_from(data, offset)
+            offset += _length.size
+            value = data[offset:offset + length]
+            offset += length
+            kwargs[name] = value.decode() if _type is str else value
+        if bitmap:
+            for i, name in enumerate(self.names):
+                if bitmap & (1 << i):
+                    kwargs[name] = None
+        return self.cls(**kwargs)
+
+
+_schemas_by_class = {}
+_schemas_by_id = {}
+
+
+def register(cls, schema_id: int, fields: list[tuple], version: int = 1):
+    """
+    Registers schema of the class. The latest version is used for encoding,
+    all registered versions are decoded
+    """
+    schema = Schema(cls=cls, schema_id=schema_id, version=version, fields=fields)
+    current = _schemas_by_class.get(cls)
+    if current is None or current.version < version:
+        _schemas_by_class[cls] = schema
+    _schemas_by_id[(schema_id, version)] = schema
+    return cls
+
+
+def encode(obj, codec: str | None = None) -> bytes:
+    if codec is None:
+        codec = settings.RABBITMQ_CODEC
+    if codec == STRUCT:
+        schema = _schemas_by_class.get(type(obj))
+        if schema is not None:
+            return schema.encode(obj)
+    return pickle.dumps(obj)
+
+
+def decode(data: bytes):
+    if not data or data[0] != MAGIC:
+        return pickle.loads(data)
+    magic, version, schema_id, schema_version = _header.unpack_from(data, 0)
+    if version != VERSION:
+        raise CodecError('Unsupported codec version: ' + str(version))
+    schema = _schemas_by_id.get((schema_id, schema_version))
+    if schema is None:
+        raise CodecError('Unknown schema: ' + str(schema_id) + ' v' + str(schema_version))
+    return schema.decode(data, _header.size)
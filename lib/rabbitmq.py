@@ -1,30 +1,145 @@
 from django.conf import settings
 import pika
-import pickle
+from lib import codec
+import sys
+import threading
+import time
+import traceback
+from functools import partial
+from queue import Queue
+from threading import Thread
+from pika.exceptions import AMQPConnectionError, AMQPChannelError
 
-_connection = {}
+# pika connections are not thread-safe, so every thread has own connections and channels
+_local = threading.local()
+
+
+def _get_state(host) -> dict:
+    if not hasattr(_local, 'state'):
+        _local.state = {}
+    if host not in _local.state:
+        _local.state[host] = {
+            'connection': None,
+            'channels': {},
+            'declared': set(),
+        }
+    return _local.state[host]
+
+
+def _reset(host):
+    state = _get_state(host)
+    connection = state['connection']
+    state['connection'] = None
+    state['channels'] = {}
+    state['declared'] = set()
+    if connection is not None and connection.is_open:
+        # noinspection PyBroadException
+        try:
+            connection.close()
+        except BaseException:
+            pass
 
 
 def get_connection(host=None):
     if host is None:
         host = settings.RABBITMQ_HOST
 
-    if host not in _connection:
-        _connection[host] = pika.BlockingConnection(pika.ConnectionParameters(host))
-        pass
+    state = _get_state(host)
+    if state['connection'] is None or not state['connection'].is_open:
+        _reset(host)
+        state['connection'] = pika.BlockingConnection(pika.ConnectionParameters(host))
+
+    return state['connection']
+
+
+def _get_channel(host, mode: str, channel_number=None):
+    """
+    Returns long-lived channel of current thread.
+
+    :param str mode: 'confirm' - publisher confirms are enabled, 'tx' - channel is transactional
+    """
+    connection = get_connection(host)
+    state = _get_state(host)
+    key = (mode, channel_number)
+    channel = state['channels'].get(key)
+    if channel is None or not channel.is_open:
+        channel = connection.channel(channel_number=channel_number)
+        match mode:
+            case 'confirm':
+                channel.confirm_delivery()
+            case 'tx':
+                channel.tx_select()
+        state['channels'][key] = channel
+    return channel
+
+
+def _declare(channel, host, queue, arguments=None):
+    state = _get_state(host)
+    if queue not in state['declared']:
+        channel.queue_declare(queue=queue, arguments=arguments)
+        state['declared'].add(queue)
 
-    return _connection[host]
+
+def _publish(host, publish):
+    # After broker restart or lost connection the message is published again by new connection
+    for attempt in range(settings.RABBITMQ_PUBLISH_RETRIES + 1):
+        try:
+            return publish()
+        except (AMQPConnectionError, AMQPChannelError):
+            _reset(host)
+            if attempt == settings.RABBITMQ_PUBLISH_RETRIES:
+                raise
 
 
 def send(queue, routing_key, body, channel_number=None, exchange='', host=None):
-    channel = get_connection(host).channel(channel_number=channel_number)
-    channel.queue_declare(queue=queue)
-    channel.basic_publish(exchange=exchange,
-                          routing_key=routing_key,
-                          body=pickle.dumps(body))
+    """
+    Publishes message and waits for confirmation of broker
+    """
+    if host is None:
+        host = settings.RABBITMQ_HOST
+
+    def publish():
+        channel = _get_channel(host=host, mode='confirm', channel_number=channel_number)
+        _declare(channel=channel, host=host, queue=queue)
+        channel.basic_publish(exchange=exchange,
+                              routing_key=routing_key,
+                              body=codec.encode(body))
 
+    _publish(host=host, publish=publish)
 
-def listen(queue, callback, channel_number=None, host=None):
+
+def send_batch(queue, routing_key, bodies: list, exchange='', host=None, queue_arguments=None):
+    """
+    Publishes messages by one transaction, so all of them are confirmed by broker with one round trip
+    """
+    if host is None:
+        host = settings.RABBITMQ_HOST
+    if not bodies:
+        return
+
+    def publish():
+        channel = _get_channel(host=host, mode='tx')
+        _declare(channel=channel, host=host, queue=queue, arguments=queue_arguments)
+        for body in bodies:
+            channel.basic_publish(exchange=exchange,
+                                  routing_key=routing_key,
+                                  body=codec.encode(body))
+        channel.tx_commit()
+
+    _publish(host=host, publish=publish)
+
+
+def listen(
+        queue,
+        callback,
+        channel_number=None,
+        host=None,
+        prefetch_count=None,
+        workers=0,
+        key_func=None,
+        queue_arguments=None,
+        retries=None
+):
     """
     Starts listener
 
@@ -40,14 +155,84 @@ def listen(queue, callback, channel_number=None, host=None):
         next available.
     :param str host: You may specify host name.
         Defaults will be taken from settings.RABBITMQ_HOST
+    :param int prefetch_count: Max number of unacknowledged messages. If it or workers is set, messages are
+        acknowledged after processing (callback is retried after settings.RABBITMQ_RETRY_DELAY, if it raises
+        exception), otherwise they are acknowledged on delivery.
+        Defaults to 4 * workers, if workers are set.
+    :param int workers: Number of threads, calling callback. Callback must not use the channel in this mode.
+    :param callable key_func: Returns key of decoded message. Messages with the same key are processed
+        by the same thread in order of delivery
+    :param dict queue_arguments: Arguments of queue declaration
+    :param int retries: Number of retries of failed message, after them it is rejected (dead-lettered, if the queue
+        has dead letter exchange). Message is retried before the next message of its key is processed.
+        Defaults to settings.RABBITMQ_RETRIES
     """
-    _channel = get_connection(host).channel(channel_number=channel_number)
-    _channel.queue_declare(queue=queue)
+    if retries is None:
+        retries = settings.RABBITMQ_RETRIES
+    if prefetch_count is None and workers > 0:
+        # Messages, waiting in lanes, are limited too
+        prefetch_count = 4 * workers
+    connection = get_connection(host)
+    _channel = connection.channel(channel_number=channel_number)
+    _channel.queue_declare(queue=queue, arguments=queue_arguments)
+    auto_ack = prefetch_count is None and workers == 0
+    if prefetch_count is not None:
+        _channel.basic_qos(prefetch_count=prefetch_count)
+
+    def process(channel, method, properties, body, sleep) -> bool:
+        """
+        Calls callback, retrying it in place, so messages of the same key stay in order
+        """
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                sleep(settings.RABBITMQ_RETRY_DELAY)
+            # noinspection PyBroadException
+            try:
+                callback(channel=channel, method=method, properties=properties, body=body)
+                return True
+            except BaseException:
+                print('Message of ' + queue + ' is failed, attempt ' + str(attempt + 1), file=sys.stderr)
+                traceback.print_exc(file=sys.stderr)
+        return False
+
+    def acknowledge(delivery_tag, success: bool):
+        if success:
+            _channel.basic_ack(delivery_tag=delivery_tag)
+            return
+        print('Message of ' + queue + ' is rejected', file=sys.stderr)
+        _channel.basic_nack(delivery_tag=delivery_tag, requeue=False)
+
+    def worker(lane: Queue):
+        while True:
+            method, properties, body = lane.get()
+            success = process(channel=_channel, method=method, properties=properties, body=body, sleep=time.sleep)
+            # Channel is used only by thread of connection
+            connection.add_callback_threadsafe(partial(acknowledge, method.delivery_tag, success))
+
+    lanes = [Queue() for _ in range(workers)]
+    for lane in lanes:
+        Thread(target=worker, args=(lane,), daemon=True).start()
 
     def callback_wrapper(channel, method, properties, body):
-        callback(channel=channel, method=method, properties=properties, body=pickle.loads(body))
+        if auto_ack:
+            callback(channel=channel, method=method, properties=properties, body=codec.decode(body))
+            return
+        # noinspection PyBroadException
+        try:
+            body = codec.decode(body)
+            key = key_func(body) if key_func is not None else method.delivery_tag
+        except BaseException:
+            # Message, which can't be decoded, is rejected without retries
+            traceback.print_exc(file=sys.stderr)
+            acknowledge(method.delivery_tag, success=False)
+            return
+        if lanes:
+            lanes[hash(key) % len(lanes)].put((method, properties, body))
+        else:
+            # Connection keeps processing heartbeats, while the thread of connection waits for retry
+            acknowledge(method.delivery_tag, success=process(channel, method, properties, body, connection.sleep))
 
     _channel.basic_consume(queue=queue,
-                           auto_ack=True,
+                           auto_ack=auto_ack,
                            on_message_callback=callback_wrapper)
     _channel.start_consuming()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+import os
+import sys
+import django
+from lib import rabbitmq, catch_and_print_exceptions
+import procname
+from threading import Thread
+from tbot.dto import *
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tbot.settings')
+
+
+def main():
+    """
+    Executes algorithm callbacks of orders, published by user data streams.
+
+    Usage: order_callbacks.py [shard ...]
+    Without arguments all shards (queues) are consumed. Processes on many nodes may consume different shards,
+    only one consumer of every shard is active, the others are standby.
+    """
+    from django.conf import settings
+    from tbot import services
+
+    shards = [int(shard) for shard in sys.argv[1:]] or list(range(settings.ORDER_CALLBACKS_SHARDS))
+    procname.setprocname("order-callbacks")
+
+    # noinspection PyUnusedLocal
+    def job_received(channel, method, properties, body: OrderCallbackJob):
+        services.execute_order_callback_job(job=body)
+
+    def exception_handler():
+        # Unacknowledged jobs will be delivered again after restart
+        os._exit(1)
+
+    @catch_and_print_exceptions(callback_after=exception_handler)
+    def consume(shard: int):
+        rabbitmq.listen(
+            queue=services.order_callback_shard_queue(shard=shard),
+            callback=job_received,
+            prefetch_count=settings.ORDER_CALLBACKS_PREFETCH,
+            workers=settings.ORDER_CALLBACKS_WORKERS,
+            key_func=lambda body: body.bot_id,
+            queue_arguments=settings.RABBITMQ_ORDER_CALLBACK_QUEUE_ARGUMENTS
+        )
+
+    # Every thread has own connection to RabbitMQ
+    threads = [Thread(target=consume, args=(shard,), daemon=True) for shard in shards]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == '__main__':
+    django.setup()
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+import os
+import asyncio
+import django
+import procname
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tbot.settings')
+
+
+def main():
+    """
+    Publishes prices of symbols of working bots to cache, look PriceCache.
+    One process serves all connections of all exchanges.
+    """
+    from tbot import services
+    from tbot.models import ExchangesNames
+    from tbot.exchanges.prices import PriceStream, PRICE_SOURCES
+
+    procname.setprocname("price-streams")
+
+    def stream(exchange: str, testnet: bool) -> PriceStream:
+        # Symbols of all exchanges, which prices are taken from the exchange
+        exchanges = [_exchange for _exchange, source in PRICE_SOURCES.items() if source == exchange]
+        return PriceStream(
+            exchange=exchange,
+            testnet=testnet,
+            symbols_func=lambda: services.get_price_symbols(exchanges=exchanges),
+            verbose=True
+        )
+
+    async def run():
+        await asyncio.gather(
+            stream(exchange=ExchangesNames.BINANCE, testnet=False).run(),
+            stream(exchange=ExchangesNames.BINANCETEST, testnet=True).run(),
+        )
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    django.setup()
+    main()
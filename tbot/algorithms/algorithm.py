@@ -60,12 +60,14 @@ class Algorithm:  # (ABC)
     def cancel_order(self, order: Order):
         self.get_exchange().cancel_order(order=order)
 
+    @catch_and_print_exceptions(exit_after=False)
     def cancel_open_orders(self):
         from tbot.services import get_active_orders
-        for order in get_active_orders(bot_id=self.bot.id):
+        orders = list(get_active_orders(bot_id=self.bot.id))
+        for order in orders:
             # TODO Decide something with this and the same prints
             print("Cancel: " + str(order))
-            self.cancel_order(order=order)
+        self.get_exchange().cancel_orders(orders=orders)
 
     def stop(self, canceled=False):
         self.bot.status = Bot.Statuses.CANCELED if canceled else Bot.Statuses.OFF
@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import datetime
+from lib import codec
 
 
 class ExchangeConnectionWorkerCommands:
@@ -12,7 +14,35 @@ class ExchangeConnectionWorkerCommand:
     command: str = ""
 
 
+codec.register(ExchangeConnectionWorkerCommand, schema_id=1, fields=[
+    ('exchange_connection_id', int),
+    ('command', str),
+])
+
+
 @dataclass
 class Callback:
     params: {}
     method: str | None = None
+
+
+@dataclass
+class OrderStatusUpdate:
+    order_id: int
+    status: str
+    # update is applied only if order wasn't updated since this time
+    updated_at: datetime | None = None
+    # other fields of Order to set
+    fields: dict = field(default_factory=dict)
+
+
+@dataclass
+class OrderCallbackJob:
+    order_id: int
+    bot_id: int
+
+
+codec.register(OrderCallbackJob, schema_id=2, fields=[
+    ('order_id', int),
+    ('bot_id', int),
+])
@@ -1,10 +1,20 @@
 from binance.exceptions import BinanceAPIException
+from django.conf import settings
 from .exchanges import Exchange
+from .rate_limiter import RateLimiter
+from .prices import PriceCache
 from binance.client import Client as BinanceClient
 from binance import AsyncClient as BinanceAsyncClient, BinanceSocketManager
 from asgiref.sync import sync_to_async
 import asyncio
-from tbot.models import ExchangeConnection, ExchangesNames, Order
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tbot.dto import OrderStatusUpdate
+from tbot.models import ExchangeConnection, ExchangesNames, Order, OrderSyncCursor
+from tbot.symbols import SymbolInfo
 from lib import catch_and_print_exceptions
 from datetime import datetime
 from django.utils import timezone
@@ -12,14 +22,106 @@ from django.utils import timezone
 
 class Binance(Exchange):
     exchange = ExchangesNames.BINANCE
+    testnet = False
 
     def __init__(self, connection: ExchangeConnection):
         super().__init__(connection=connection)
-        self.client = BinanceClient(connection.API_key, connection.API_secret)
-        self._async_client: BinanceAsyncClient | type(None) = None
+        self.client = BinanceClient(connection.API_key, connection.API_secret, testnet=self.testnet)
+        # Instances are shared per connection (look Exchange.__new__), and __init__ runs on every construction,
+        # so the live async client and the rate limiter must not be replaced
+        if not hasattr(self, '_async_clients'):
+            # Client's HTTP session is bound to the event loop, so every loop (stream loop, threads of callbacks)
+            # has own client
+            self._async_clients: dict[asyncio.AbstractEventLoop, BinanceAsyncClient] = weakref.WeakKeyDictionary()
+            self._async_clients_lock = threading.Lock()
+        if not hasattr(self, 'rate_limiter'):
+            # Buckets and ban state of the connection live as long as the instance
+            self.rate_limiter = RateLimiter(
+                name=str(connection.id),
+                weight_limit=settings.BINANCE_REQUEST_WEIGHT_LIMIT,
+                weight_interval=60,
+                order_limit=settings.BINANCE_ORDER_COUNT_LIMIT,
+                order_interval=10,
+            )
+
+    def _request(
+            self,
+            method: str,
+            weight: int = 1,
+            orders: int = 0,
+            priority: int = RateLimiter.PRIORITY_DEFAULT,
+            **params
+    ):
+        """
+        Calls method of REST client within rate limits of the connection.
+
+        :param str method: Name of method of binance.client.Client
+        :param int weight: Request weight, https://binance-docs.github.io/apidocs/spot/en/#limits
+        :param int orders: Number of orders, placed by the request
+        :param int priority: RateLimiter.PRIORITY_*
+        """
+        for attempt in range(settings.BINANCE_REQUEST_RETRIES + 1):
+            self.rate_limiter.acquire(weight=weight, orders=orders, priority=priority)
+            try:
+                result = getattr(self.client, method)(**params)
+            except BinanceAPIException as e:
+                headers = getattr(e.response, 'headers', None)
+                self.rate_limiter.update(headers)
+                if self.rate_limiter.rejected(e.status_code, headers) and attempt < settings.BINANCE_REQUEST_RETRIES:
+                    continue
+                raise e
+            self.rate_limiter.update(getattr(self.client.response, 'headers', None))
+            return result
+
+    async def _arequest(
+            self,
+            method: str,
+            weight: int = 1,
+            orders: int = 0,
+            priority: int = RateLimiter.PRIORITY_DEFAULT,
+            **params
+    ):
+        client = self._get_async_client()
+        for attempt in range(settings.BINANCE_REQUEST_RETRIES + 1):
+            await self.rate_limiter.aacquire(weight=weight, orders=orders, priority=priority)
+            try:
+                result = await getattr(client, method)(**params)
+            except BinanceAPIException as e:
+                headers = getattr(e.response, 'headers', None)
+                self.rate_limiter.update(headers)
+                if self.rate_limiter.rejected(e.status_code, headers) and attempt < settings.BINANCE_REQUEST_RETRIES:
+                    continue
+                raise e
+            self.rate_limiter.update(getattr(client.response, 'headers', None))
+            return result
+
+    def _get_async_client(self) -> BinanceAsyncClient:
+        # Client is shared by all coroutines of the running loop
+        loop = asyncio.get_running_loop()
+        with self._async_clients_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = BinanceAsyncClient(
+                    api_key=self.exchange_connection.API_key,
+                    api_secret=self.exchange_connection.API_secret,
+                    testnet=self.testnet
+                )
+                self._async_clients[loop] = client
+        return client
+
+    def has_async_client(self) -> bool:
+        with self._async_clients_lock:
+            return asyncio.get_running_loop() in self._async_clients
+
+    async def aclose(self):
+        # Only client of the running loop is closed, clients of other loops are in use
+        with self._async_clients_lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close_connection()
 
     def get_asset_balance(self, asset: str, calc_free=True, calc_locked=False):
-        info = self.client.get_asset_balance(asset=asset)
+        info = self._request('get_asset_balance', weight=10, asset=asset)
         result = 0
         if calc_free:
             result += float(info['free'])
@@ -28,79 +130,239 @@ class Binance(Exchange):
         return result
 
     def get_asset_price(self, symbol: str):
-        result = self.client.get_avg_price(symbol=symbol)
+        # Average price of the last 5 minutes, from price_streams.py or by REST
+        price = PriceCache.get(exchange=self.exchange, symbol=symbol)
+        if price is not None:
+            return price
+        result = self._request('get_avg_price', weight=1, symbol=symbol)
         return float(result['price'])
 
     def _cancel_order(self, symbol: str, client_id: str):
         try:
-            self.client.cancel_order(symbol=symbol, origClientOrderId=client_id)
+            self._request(
+                'cancel_order',
+                weight=1,
+                priority=RateLimiter.PRIORITY_ORDER,
+                symbol=symbol,
+                origClientOrderId=client_id
+            )
         except BinanceAPIException as e:
             if e.code != -2011:
                 raise e
 
-    def _sync_symbol_history(self, symbol: str, verbose: bool = False):
+    async def _acancel_order(self, symbol: str, client_id: str):
+        try:
+            await self._arequest(
+                'cancel_order',
+                weight=1,
+                priority=RateLimiter.PRIORITY_ORDER,
+                symbol=symbol,
+                origClientOrderId=client_id
+            )
+        except BinanceAPIException as e:
+            if e.code != -2011:
+                raise e
+
+    # https://binance-docs.github.io/apidocs/spot/en/#all-orders-user_data
+    SYNC_PAGE_LIMIT = 1000
+
+    async def _async_sync_history(self, verbose: bool = False):
+        """
+        Fetches histories of all symbols of the connection concurrently (in limits of rate limiter),
+        then applies them to DB by one batch
+        """
         time_start = datetime.now(tz=timezone.utc)
+        cursors = await sync_to_async(self._sync_cursors, thread_sensitive=True)()
+        active_order_ids = await sync_to_async(self._sync_active_order_ids, thread_sensitive=True)(
+            symbols=[cursor.symbol for cursor in cursors]
+        )
         if verbose:
-            print('Sync: ' + symbol + ' ')
-        # https://binance-docs.github.io/apidocs/spot/en/#all-orders-user_data
-        # 500 last orders by default
-        orders = self.client.get_all_orders(symbol=symbol)
+            print('Sync: ' + ', '.join(cursor.symbol for cursor in cursors) + ' ')
+        histories = await asyncio.gather(*[
+            self._async_fetch_symbol_history(cursor=cursor, active_order_ids=active_order_ids.get(cursor.symbol, []))
+            for cursor in cursors
+        ])
+        await sync_to_async(self._sync_apply, thread_sensitive=True)(
+            cursors=cursors,
+            orders=[exchange_order_data for history in histories for exchange_order_data in history],
+            time_start=time_start,
+            verbose=verbose
+        )
+
+    def _sync_cursors(self) -> list[OrderSyncCursor]:
+        import tbot.services as services
+        symbols = set(
+            services.get_bots_by_connection_id(exchange_connection_id=self.exchange_connection.id)
+            .values_list('symbol__symbol', flat=True)
+        )
+        cursors = OrderSyncCursor.objects.filter(exchange_connection=self.exchange_connection, symbol__in=symbols)
+        missing = symbols - {cursor.symbol for cursor in cursors}
+        if missing:
+            OrderSyncCursor.objects.bulk_create(
+                [OrderSyncCursor(exchange_connection=self.exchange_connection, symbol=symbol) for symbol in missing],
+                ignore_conflicts=True
+            )
+        return list(OrderSyncCursor.objects.filter(exchange_connection=self.exchange_connection, symbol__in=symbols))
+
+    def _sync_active_order_ids(self, symbols: list[str]) -> dict[str, list[int]]:
+        """
+        Ids of active orders of the connection by symbol
+        """
+        active_order_ids = {}
+        for order_id, symbol in Order.objects.filter(
+                exchange_connection=self.exchange_connection,
+                status=Order.Statuses.ACTIVE,
+                position__round__bot__symbol__symbol__in=symbols
+        ).values_list('id', 'position__round__bot__symbol__symbol'):
+            active_order_ids.setdefault(symbol, []).append(order_id)
+        return active_order_ids
+
+    async def _async_fetch_symbol_history(self, cursor: OrderSyncCursor, active_order_ids: list[int]) -> list[dict]:
+        """
+        Returns new orders of the symbol from the cursor and current state of its active orders,
+        moves the cursor (it is not saved)
+        """
+        # Without cursor (first sync) - 500 last orders, otherwise pages of orders from the cursor
+        params = {'orderId': cursor.last_order_id, 'limit': self.SYNC_PAGE_LIMIT} if cursor.last_order_id else {}
+        history = []
+        while True:
+            orders = await self._arequest(
+                'get_all_orders',
+                weight=10,
+                priority=RateLimiter.PRIORITY_SYNC,
+                symbol=cursor.symbol,
+                **params
+            )
+            history += orders
+            if orders:
+                cursor.last_order_id = max([cursor.last_order_id] + [o['orderId'] + 1 for o in orders])
+            if not params or len(orders) < self.SYNC_PAGE_LIMIT:
+                break
+            params['orderId'] = cursor.last_order_id
+
+        # Active orders, placed before the cursor, are refreshed by one request of open orders of the symbol,
+        # and orders, which are not open anymore, one by one
+        received = {self.order_parse_id(o['clientOrderId']) for o in history}
+        active_order_ids = [order_id for order_id in active_order_ids if order_id not in received]
+        if not active_order_ids:
+            return history
+        open_orders = await self._arequest(
+            'get_open_orders',
+            weight=6,
+            priority=RateLimiter.PRIORITY_SYNC,
+            symbol=cursor.symbol
+        )
+        history += open_orders
+        received = {self.order_parse_id(o['clientOrderId']) for o in open_orders}
+        for order_id in active_order_ids:
+            if order_id in received:
+                continue
+            try:
+                history.append(await self._arequest(
+                    'get_order',
+                    weight=4,
+                    priority=RateLimiter.PRIORITY_SYNC,
+                    symbol=cursor.symbol,
+                    origClientOrderId=self.order_encode_id(order_id=order_id)
+                ))
+            except BinanceAPIException as e:
+                # Order does not exist
+                if e.code != -2013:
+                    raise e
+        return history
+
+    def _sync_apply(self, cursors: list[OrderSyncCursor], orders: list[dict], time_start: datetime, verbose: bool):
+        self._sync_orders(orders=orders, time_start=time_start, verbose=verbose)
+        for cursor in cursors:
+            cursor.updated_at = time_start
+        OrderSyncCursor.objects.bulk_update(cursors, ['last_order_id', 'updated_at'])
+
+    @staticmethod
+    def _sync_orders(orders: list[dict], time_start: datetime, verbose: bool = False):
+        """
+        Applies statuses of exchange orders to bot orders by one select and one batch update
+        """
+        exchange_orders = {}
         for exchange_order_data in orders:
             order_id = Exchange.order_parse_id(exchange_order_data['clientOrderId'])
             if order_id is None:
                 if verbose:
                     print("-", end='')
                 continue
-            try:
-                order = Order.objects.get(id=order_id)
-            except Order.DoesNotExist:
+            exchange_orders[order_id] = exchange_order_data
+        if not exchange_orders:
+            return
+        statuses = dict(Order.objects.filter(id__in=list(exchange_orders.keys())).values_list('id', 'status'))
+
+        updates = []
+        for order_id, exchange_order_data in exchange_orders.items():
+            if order_id not in statuses:
                 if verbose:
                     print("?", end='')
                 continue
 
-            updated = False
+            fields = {}
             match exchange_order_data['status']:
                 case 'NEW':  # The order has been accepted by the engine.
-                    if order.status != Order.Statuses.ACTIVE:
-                        Exchange.callback_order_new(order_id=order.id, updated_at=time_start)
-                        updated = True
+                    status = Order.Statuses.ACTIVE
                 case 'FILLED':  # The order has been completed.
-                    if order.status != Order.Statuses.FILLED:
-                        Exchange.callback_order_filled(
-                            order_id=order_id,
-                            result_quote_asset_quantity=float(exchange_order_data['cummulativeQuoteQty']),
-                            result_filled_quantity=float(exchange_order_data['executedQty']),
-                            updated_at=time_start
-                        )
-                        updated = True
+                    status = Order.Statuses.FILLED
+                    fields = {
+                        'result_quote_asset_quantity': float(exchange_order_data['cummulativeQuoteQty']),
+                        'result_filled_quantity': float(exchange_order_data['executedQty']),
+                    }
                 case 'CANCELED':  # The order has been canceled by the user
-                    if order.status != Order.Statuses.CANCELED:
-                        Exchange.callback_order_canceled(order_id=order.id, updated_at=time_start)
-                        updated = True
-                case 'PENDING_CANCEL':  # Currently unused
-                    pass
-                case 'REJECTED':  # The order was not accepted by the engine and not processed.
-                    pass
+                    status = Order.Statuses.CANCELED
                 case 'EXPIRED':
                     # The order was canceled according to the order type's rules
                     # (e.g. LIMIT FOK orders with no fill, LIMIT IOC or MARKET orders
                     # that partially fill) or by the exchange, (e.g. orders canceled
                     # during liquidation, orders canceled during maintenance)
-                    if order.status != Order.Statuses.EXPIRED:
-                        Exchange.callback_order_expired(order_id=order.id, updated_at=time_start)
-                        updated = True
-
+                    status = Order.Statuses.EXPIRED
+                case _:
+                    # PENDING_CANCEL - currently unused
+                    # REJECTED - the order was not accepted by the engine and not processed.
+                    status = None
+
+            updated = status is not None and statuses[order_id] != status
+            if updated:
+                updates.append(
+                    OrderStatusUpdate(order_id=order_id, status=status, updated_at=time_start, fields=fields)
+                )
             if verbose:
                 print("!" if updated else '.', end='')
 
+        if updates:
+            Exchange.dispatch_order_callbacks(orders=Exchange.callback_orders(updates=updates))
+
     class UserDataStream:
-        def __init__(self, api_key: str, api_secret: str, verbose: bool, sync_func):
+        # Number of last execution reports, remembered for deduplication
+        RECEIVED_MAX_SIZE = 10000
+
+        def __init__(self, exchange, verbose: bool, loop: asyncio.AbstractEventLoop | None = None, on_stop=None):
+            """
+            :param Binance exchange: Exchange of the connection
+            :param bool verbose: Print received events
+            :param loop: Event loop, shared by many streams. If not set, stream runs own loop until it is stopped.
+            :param callable on_stop: Called with the stream, when it is stopped (only for shared loop)
+            """
+            self.exchange: Binance = exchange
             self.verbose = verbose
+            self.on_stop = on_stop
             self._async_client = None
-            self.api_key = api_key
-            self.api_secret = api_secret
-            self.sync_func = sync_func
-            self._run_loop()
+            self._updates: asyncio.Queue | None = None
+            self._synced: asyncio.Event | None = None
+            self._listener: asyncio.Task | None = None
+            self._received = OrderedDict()
+            self._lanes: list[asyncio.Queue] = []
+            self._tasks = []
+            if loop is None:
+                self._own_loop = True
+                self._run_loop()
+            else:
+                self._own_loop = False
+                self.loop = loop
+                self._create_task(self.start())
 
         def _run_loop(self):
             _self = self
@@ -112,20 +374,68 @@ class Binance(Exchange):
 
             self.loop = asyncio.new_event_loop()
             self.loop.set_exception_handler(exception_handler)
-            self.loop.create_task(self.start())
+            self._create_task(self.start())
             self.loop.run_forever()
 
-        async def task_wait_and_stop(self):
-            await asyncio.sleep(23 * 60 * 60)  # 23H
-            if self.verbose:
-                print("<<STOP BY TIMER>> (Will be started automatically)")
-            self.loop.stop()  # process will be started by parent process manager
+        def _create_task(self, coro):
+            def done(_task: asyncio.Task):
+                if _task in self._tasks:
+                    self._tasks.remove(_task)
+                if not _task.cancelled() and _task.exception() is not None:
+                    print(_task.exception(), file=sys.stderr)
+                    self.stop()
+
+            task = self.loop.create_task(coro)
+            task.add_done_callback(done)
+            self._tasks.append(task)
+            return task
+
+        def stop(self):
+            if self._own_loop:
+                self.loop.stop()
+                return
+            tasks, self._tasks = self._tasks, []
+            if not tasks:
+                return
+            for task in tasks:
+                task.cancel()
+            self.loop.create_task(self.exchange.aclose())
+            if self.on_stop is not None:
+                self.on_stop(self)
+
+        async def task_rotate(self):
+            """
+            Connection of user socket lives 24H at most, so it is replaced by new one before that.
+            New socket is opened before old one is closed, events received by both of them are deduplicated.
+            """
+            while True:
+                await asyncio.sleep(settings.USER_DATA_STREAM_ROTATE_INTERVAL)
+                if self.verbose:
+                    print("<<ROTATE SOCKET>>")
+                listener = self._listener
+                ready = asyncio.Event()
+                self._listener = self._create_task(self.task_listen(ready=ready))
+                await ready.wait()
+                # Events in flight are received by both sockets
+                await asyncio.sleep(settings.USER_DATA_STREAM_ROTATE_OVERLAP)
+                listener.cancel()
+
+        def _is_duplicate(self, res: {}) -> bool:
+            # Order id, execution type, order status, trade id and event time identify one execution report
+            key = (res.get('i'), res.get('x'), res.get('X'), res.get('t'), res.get('E'))
+            if key in self._received:
+                return True
+            self._received[key] = True
+            if len(self._received) > self.RECEIVED_MAX_SIZE:
+                self._received.popitem(last=False)
+            return False
 
         async def task_sync_history(self):
-            await sync_to_async(
-                self.sync_func,
-                thread_sensitive=True
-            )()
+            await self.exchange._async_sync_history(verbose=self.verbose)
+            if self.verbose:
+                print("<<SYNC COMPLETE>>")
+            # Events, received during the sync, are written after it
+            self._synced.set()
 
         async def task_ping(self):
             while True:
@@ -135,7 +445,7 @@ class Binance(Exchange):
                     print("<ping>")
                 await self._async_client.ping()
 
-        async def task_listen(self):
+        async def task_listen(self, ready: asyncio.Event | None = None):
             bm = BinanceSocketManager(self._async_client)
             # start any sockets here, i.e a trade socket
             user_socket = bm.user_socket()
@@ -145,7 +455,10 @@ class Binance(Exchange):
             async with user_socket as user_socket_cm:
                 if self.verbose:
                     print("Socket receiving")
-                self.loop.create_task(self.task_sync_history())
+                if ready is None:
+                    self._create_task(self.task_sync_history())
+                else:
+                    ready.set()
                 while True:
                     res = await user_socket_cm.recv()
                     if self.verbose:
@@ -160,21 +473,78 @@ class Binance(Exchange):
                         continue
                     match res['e']:
                         case 'executionReport':
-                            # print("executionReport: start")
-                            await sync_to_async(
-                                self.execution_report,
-                                thread_sensitive=True
-                            )(res)
-                            # print("executionReport: end")
+                            if self._is_duplicate(res):
+                                continue
+                            update = self.execution_report(res)
+                            if update is not None:
+                                # Waits only if the queue is full, so events are never dropped
+                                await self._updates.put(update)
+
+        async def task_write(self):
+            """
+            Collects status updates during settings.USER_DATA_STREAM_BATCH_WINDOW and writes them by one batch.
+            Batches are written one by one, so updates of one order are applied in order of receiving.
+            Algorithm callbacks of written orders are dispatched to lanes after that.
+            Nothing is written until history sync is complete, so events received during it are replayed after it.
+            """
+            loop = asyncio.get_running_loop()
+            await self._synced.wait()
+            while True:
+                updates = [await self._updates.get()]
+                deadline = loop.time() + settings.USER_DATA_STREAM_BATCH_WINDOW
+                while len(updates) < settings.USER_DATA_STREAM_BATCH_SIZE:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        updates.append(await asyncio.wait_for(self._updates.get(), timeout=timeout))
+                    except asyncio.TimeoutError:
+                        break
+                orders = await loop.run_in_executor(self.get_executor(), self.write_updates, updates)
+                for order in orders:
+                    await self._lanes[self._lane(order)].put(order)
+
+        def _lane(self, order: Order) -> int:
+            # All callbacks of one bot go to the same lane, so they are executed in order of receiving
+            return order.position.round.bot_id % len(self._lanes)
+
+        async def task_process(self, lane: asyncio.Queue):
+            loop = asyncio.get_running_loop()
+            while True:
+                order = await lane.get()
+                try:
+                    await loop.run_in_executor(self.get_executor(), self.dispatch_callback, order)
+                finally:
+                    lane.task_done()
+
+        _executor: ThreadPoolExecutor | type(None) = None
+
+        @classmethod
+        def get_executor(cls) -> ThreadPoolExecutor:
+            """
+            Threads for DB work of execution reports, shared by all streams of the process
+            """
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=settings.USER_DATA_STREAM_DB_THREADS,
+                    thread_name_prefix='execution_report'
+                )
+            return cls._executor
 
         async def start(self):
-            self._async_client = BinanceAsyncClient(
-                api_key=self.api_key,
-                api_secret=self.api_secret
-            )
-            self.loop.create_task(self.task_listen())
-            self.loop.create_task(self.task_ping())
-            self.loop.create_task(self.task_wait_and_stop())
+            self._async_client = self.exchange._get_async_client()
+            self._updates = asyncio.Queue(maxsize=settings.USER_DATA_STREAM_QUEUE_SIZE)
+            self._synced = asyncio.Event()
+            self._lanes = [
+                asyncio.Queue(maxsize=settings.USER_DATA_STREAM_QUEUE_SIZE)
+                for _ in range(settings.USER_DATA_STREAM_LANES)
+            ]
+            for lane in self._lanes:
+                self._create_task(self.task_process(lane=lane))
+            self._create_task(self.task_write())
+            self._listener = self._create_task(self.task_listen())
+            self._create_task(self.task_ping())
+            self._create_task(self.task_rotate())
 
         def read_res(self, res: {}, i):
             if i not in res:
@@ -187,160 +557,272 @@ class Binance(Exchange):
             result = self.read_res(res=res, i=i)
             return 0 if result is None else float(result)
 
-        def execution_report(self, res: {}):
-            # noinspection PyShadowingNames
-            def exception_handler():
-                self.loop.stop()
+        def _exception_handler(self):
+            self.loop.call_soon_threadsafe(self.stop)
 
-            @catch_and_print_exceptions(callback_after=exception_handler)
+        def write_updates(self, updates: list[OrderStatusUpdate]) -> list[Order]:
+            @catch_and_print_exceptions(callback_after=self._exception_handler)
             def execution():
-                if self.verbose:
-                    print('[' + res['X'] + ']')
-                match res['X']:
-                    case 'NEW':
-                        # print('[[' + res['c'] + ']]')
-                        client_id = self.read_res(res, 'c')
-                        if not client_id:
-                            return
-                        order_id = Exchange.order_parse_id(client_id)
-                        if not order_id:
-                            return
-                        # print('[[[' + str(order_id) + ']]]')
-                        Exchange.callback_order_new(order_id=order_id)
-                    case 'CANCELED':
-                        client_id = self.read_res(res, 'C')
-                        if not client_id:
-                            return
-                        order_id = Exchange.order_parse_id(client_id)
-                        if not order_id:
-                            return
-                        Exchange.callback_order_canceled(order_id=order_id)
-                    case 'FILLED':
-                        client_id = self.read_res(res, 'c')
-                        if not client_id:
-                            return
-                        order_id = Exchange.order_parse_id(client_id)
-                        if not order_id:
-                            return
-                        result_quote_asset_quantity = self.read_res_float(res, 'Z')
-                        result_filled_quantity = self.read_res_float(res, 'z')
-                        if self.verbose:
-                            print('[' + str(result_quote_asset_quantity) + ', ' + str(result_filled_quantity) + ']')
-                        Exchange.callback_order_filled(
-                            order_id=order_id,
-                            result_quote_asset_quantity=result_quote_asset_quantity,
-                            result_filled_quantity=result_filled_quantity
-                        )
-                    case 'EXPIRED':
-                        # TODO: check is it works
-                        client_id = self.read_res(res, 'C')
-                        if not client_id:
-                            return
-                        order_id = Exchange.order_parse_id(client_id)
-                        if not order_id:
-                            return
-                        Exchange.callback_order_expired(order_id=order_id)
+                orders = Exchange.callback_orders(updates=updates)
+                if settings.ORDER_CALLBACKS_QUEUE:
+                    # Callbacks are executed by order_callbacks.py, so only jobs are published here
+                    Exchange.dispatch_order_callbacks(orders=orders)
+                    return []
+                return orders
+
+            return execution() or []
+
+        def dispatch_callback(self, order: Order):
+            @catch_and_print_exceptions(callback_after=self._exception_handler)
+            def execution():
+                Exchange.dispatch_order_callbacks(orders=[order])
 
             execution()
 
-    def _sync_history(self):
-        import tbot.services as services
-        symbols = []
-        for bot in services.get_bots_by_connection_id(exchange_connection_id=self.exchange_connection.id):
-            if bot.symbol not in symbols:
-                symbols.append(bot.symbol)
-        for symbol in symbols:
-            self._sync_symbol_history(symbol=symbol.symbol, verbose=True)
+        def execution_report(self, res: {}) -> OrderStatusUpdate | None:
+            if self.verbose:
+                print('[' + res['X'] + ']')
+            match res['X']:
+                case 'NEW':
+                    status = Order.Statuses.ACTIVE
+                    client_id = self.read_res(res, 'c')
+                case 'CANCELED':
+                    status = Order.Statuses.CANCELED
+                    client_id = self.read_res(res, 'C')
+                case 'FILLED':
+                    status = Order.Statuses.FILLED
+                    client_id = self.read_res(res, 'c')
+                case 'EXPIRED':
+                    # TODO: check is it works
+                    status = Order.Statuses.EXPIRED
+                    client_id = self.read_res(res, 'C')
+                case _:
+                    return None
+            if not client_id:
+                return None
+            order_id = Exchange.order_parse_id(client_id)
+            if not order_id:
+                return None
+            fields = {}
+            if status == Order.Statuses.FILLED:
+                fields['result_quote_asset_quantity'] = self.read_res_float(res, 'Z')
+                fields['result_filled_quantity'] = self.read_res_float(res, 'z')
+                if self.verbose:
+                    print('[' + str(fields['result_quote_asset_quantity']) + ', '
+                          + str(fields['result_filled_quantity']) + ']')
+            return OrderStatusUpdate(order_id=order_id, status=status, fields=fields)
 
     def user_data_stream_execution(self):
-        self.UserDataStream(
-            api_key=self.exchange_connection.API_key,
-            api_secret=self.exchange_connection.API_secret,
-            verbose=True,
-            sync_func=self._sync_history
-        )
+        self.UserDataStream(exchange=self, verbose=True)
+
+    def user_data_stream_attach(self, loop: asyncio.AbstractEventLoop, on_stop=None):
+        return self.UserDataStream(exchange=self, verbose=True, loop=loop, on_stop=on_stop)
 
-    def _round_price(self, symbol: str, price: float) -> float:
+    def _symbol_info(self, symbol: str, symbol_info: SymbolInfo | None) -> SymbolInfo:
+        # Async methods pass symbol, loaded by aget_symbol(), so the event loop isn't blocked by DB query
+        return symbol_info if symbol_info is not None else self.get_symbol(symbol=symbol)
+
+    def _round_price(self, symbol: str, price: float, symbol_info: SymbolInfo | None = None) -> float:
         # PRICE_FILTER
         # price % tickSize == 0
-        tick_size = self.get_symbol(symbol=symbol).tick_size
-        return self.to_float(round(price / tick_size) * tick_size)
+        return self._symbol_info(symbol=symbol, symbol_info=symbol_info).precision.round_price(price)
 
-    def _round_lot(self, symbol: str, quantity: float) -> float:
+    def _round_lot(self, symbol: str, quantity: float, symbol_info: SymbolInfo | None = None) -> float:
         # LOT_SIZE
         # (quantity-minQty) % stepSize == 0
-        _symbol = self.get_symbol(symbol=symbol)
+        _symbol = self._symbol_info(symbol=symbol, symbol_info=symbol_info)
         # TODO Someday this assertion should be removed, and logic updated, but it will be someday, not now
         assert _symbol.min_qty == _symbol.step_size
-        return self.to_float(round(quantity / _symbol.step_size) * _symbol.step_size)
+        return _symbol.precision.round_lot(quantity)
 
-    def _round_quote_qty(self, symbol: str, quote_quantity: float) -> float:
-        _symbol = self.get_symbol(symbol=symbol)
-        d = _symbol.step_size * _symbol.tick_size
-        return self.to_float(round(quote_quantity / d) * d)
+    def _round_quote_qty(self, symbol: str, quote_quantity: float, symbol_info: SymbolInfo | None = None) -> float:
+        return self._symbol_info(symbol=symbol, symbol_info=symbol_info).precision.round_quote_qty(quote_quantity)
 
-    def _new_order_limit_buy(self, symbol: str, quantity: float, price: float, client_id: str):
-        self.client.create_order(
-            symbol=symbol,
-            side=BinanceClient.SIDE_BUY,
-            type=BinanceClient.ORDER_TYPE_LIMIT,
-            timeInForce=BinanceClient.TIME_IN_FORCE_GTC,
-            quantity=self._round_lot(symbol=symbol, quantity=quantity),
-            price=self._round_price(symbol=symbol, price=price),
-            newClientOrderId=client_id
-        )
-
-    def _new_order_limit_sell(self, symbol: str, quantity: float, price: float, client_id: str):
-        self.client.create_order(
+    def _params_limit(
+            self,
+            symbol: str,
+            side: str,
+            quantity: float,
+            price: float,
+            client_id: str,
+            symbol_info: SymbolInfo | None = None
+    ) -> dict:
+        return dict(
             symbol=symbol,
-            side=BinanceClient.SIDE_SELL,
+            side=side,
             type=BinanceClient.ORDER_TYPE_LIMIT,
             timeInForce=BinanceClient.TIME_IN_FORCE_GTC,
-            quantity=self._round_lot(symbol=symbol, quantity=quantity),
-            price=self._round_price(symbol=symbol, price=price),
+            quantity=self._round_lot(symbol=symbol, quantity=quantity, symbol_info=symbol_info),
+            price=self._round_price(symbol=symbol, price=price, symbol_info=symbol_info),
             newClientOrderId=client_id
         )
 
-    def _new_order_market_buy(self, symbol: str, quote_quantity: float, client_id: str):
-        self.client.create_order(
+    def _params_market_buy(
+            self,
+            symbol: str,
+            quote_quantity: float,
+            client_id: str,
+            symbol_info: SymbolInfo | None = None
+    ) -> dict:
+        return dict(
             symbol=symbol,
             side=BinanceClient.SIDE_BUY,
             type=BinanceClient.ORDER_TYPE_MARKET,
-            quoteOrderQty=self._round_quote_qty(symbol=symbol, quote_quantity=quote_quantity),
+            quoteOrderQty=self._round_quote_qty(symbol=symbol, quote_quantity=quote_quantity, symbol_info=symbol_info),
             newClientOrderId=client_id
         )
 
-    def _new_order_market_sell(self, symbol: str, quantity: float, client_id: str):
-        self.client.create_order(
+    def _params_market_sell(
+            self,
+            symbol: str,
+            quantity: float,
+            client_id: str,
+            symbol_info: SymbolInfo | None = None
+    ) -> dict:
+        return dict(
             symbol=symbol,
             side=BinanceClient.SIDE_SELL,
             type=BinanceClient.ORDER_TYPE_MARKET,
-            quantity=self._round_lot(symbol=symbol, quantity=quantity),
+            quantity=self._round_lot(symbol=symbol, quantity=quantity, symbol_info=symbol_info),
             newClientOrderId=client_id
         )
 
-    def _new_order_oco_buy(
+    def _params_oco(
             self,
             symbol: str,
+            side: str,
             quantity: float,
             price: float,
             stop_price: float,
             limit_client_id: str,
             stop_limit_client_id: str,
             stop_limit_price: float | None = None,
-    ):
-        self.client.create_oco_order(
+            symbol_info: SymbolInfo | None = None
+    ) -> dict:
+        return dict(
             symbol=symbol,
-            side=BinanceClient.SIDE_BUY,
-            quantity=self._round_lot(symbol=symbol, quantity=quantity),
-            price=self._round_price(symbol=symbol, price=price),
-            stopPrice=self._round_price(symbol=symbol, price=stop_price),
-            stopLimitPrice=self._round_price(symbol=symbol, price=stop_limit_price),
+            side=side,
+            quantity=self._round_lot(symbol=symbol, quantity=quantity, symbol_info=symbol_info),
+            price=self._round_price(symbol=symbol, price=price, symbol_info=symbol_info),
+            stopPrice=self._round_price(symbol=symbol, price=stop_price, symbol_info=symbol_info),
+            stopLimitPrice=self._round_price(symbol=symbol, price=stop_limit_price, symbol_info=symbol_info),
             stopLimitTimeInForce=BinanceClient.TIME_IN_FORCE_GTC,
             limitClientOrderId=limit_client_id,
             stopClientOrderId=stop_limit_client_id,
         )
 
+    def _params_stop_limit(
+            self,
+            symbol: str,
+            side: str,
+            order_type: str,
+            quantity: float,
+            stop_price: float,
+            price: float,
+            client_id: str,
+            symbol_info: SymbolInfo | None = None
+    ) -> dict:
+        return dict(
+            symbol=symbol,
+            side=side,
+            type=order_type,
+            timeInForce=BinanceClient.TIME_IN_FORCE_GTC,
+            quantity=self._round_lot(symbol=symbol, quantity=quantity, symbol_info=symbol_info),
+            price=self._round_price(symbol=symbol, price=price, symbol_info=symbol_info),
+            stopPrice=self._round_price(symbol=symbol, price=stop_price, symbol_info=symbol_info),
+            newClientOrderId=client_id
+        )
+
+    def _new_order_limit_buy(self, symbol: str, quantity: float, price: float, client_id: str):
+        self._request('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_limit(
+            symbol=symbol, side=BinanceClient.SIDE_BUY, quantity=quantity, price=price, client_id=client_id
+        ))
+
+    async def _anew_order_limit_buy(self, symbol: str, quantity: float, price: float, client_id: str):
+        symbol_info = await self.aget_symbol(symbol=symbol)
+        await self._arequest('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_limit(
+            symbol=symbol, side=BinanceClient.SIDE_BUY, quantity=quantity, price=price, client_id=client_id,
+            symbol_info=symbol_info
+        ))
+
+    def _new_order_limit_sell(self, symbol: str, quantity: float, price: float, client_id: str):
+        self._request('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_limit(
+            symbol=symbol, side=BinanceClient.SIDE_SELL, quantity=quantity, price=price, client_id=client_id
+        ))
+
+    async def _anew_order_limit_sell(self, symbol: str, quantity: float, price: float, client_id: str):
+        symbol_info = await self.aget_symbol(symbol=symbol)
+        await self._arequest('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_limit(
+            symbol=symbol, side=BinanceClient.SIDE_SELL, quantity=quantity, price=price, client_id=client_id,
+            symbol_info=symbol_info
+        ))
+
+    def _new_order_market_buy(self, symbol: str, quote_quantity: float, client_id: str):
+        self._request('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_market_buy(
+            symbol=symbol, quote_quantity=quote_quantity, client_id=client_id
+        ))
+
+    async def _anew_order_market_buy(self, symbol: str, quote_quantity: float, client_id: str):
+        symbol_info = await self.aget_symbol(symbol=symbol)
+        await self._arequest('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_market_buy(
+            symbol=symbol, symbol_info=symbol_info, quote_quantity=quote_quantity, client_id=client_id
+        ))
+
+    def _new_order_market_sell(self, symbol: str, quantity: float, client_id: str):
+        self._request('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_market_sell(
+            symbol=symbol, quantity=quantity, client_id=client_id
+        ))
+
+    async def _anew_order_market_sell(self, symbol: str, quantity: float, client_id: str):
+        symbol_info = await self.aget_symbol(symbol=symbol)
+        await self._arequest('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_market_sell(
+            symbol=symbol, symbol_info=symbol_info, quantity=quantity, client_id=client_id
+        ))
+
+    def _new_order_oco_buy(
+            self,
+            symbol: str,
+            quantity: float,
+            price: float,
+            stop_price: float,
+            limit_client_id: str,
+            stop_limit_client_id: str,
+            stop_limit_price: float | None = None,
+    ):
+        self._request('create_oco_order', orders=2, priority=RateLimiter.PRIORITY_ORDER, **self._params_oco(
+            symbol=symbol,
+            side=BinanceClient.SIDE_BUY,
+            quantity=quantity,
+            price=price,
+            stop_price=stop_price,
+            limit_client_id=limit_client_id,
+            stop_limit_client_id=stop_limit_client_id,
+            stop_limit_price=stop_limit_price,
+        ))
+
+    async def _anew_order_oco_buy(
+            self,
+            symbol: str,
+            quantity: float,
+            price: float,
+            stop_price: float,
+            limit_client_id: str,
+            stop_limit_client_id: str,
+            stop_limit_price: float | None = None,
+    ):
+        symbol_info = await self.aget_symbol(symbol=symbol)
+        await self._arequest('create_oco_order', orders=2, priority=RateLimiter.PRIORITY_ORDER, **self._params_oco(
+            symbol=symbol,
+            symbol_info=symbol_info,
+            side=BinanceClient.SIDE_BUY,
+            quantity=quantity,
+            price=price,
+            stop_price=stop_price,
+            limit_client_id=limit_client_id,
+            stop_limit_client_id=stop_limit_client_id,
+            stop_limit_price=stop_limit_price,
+        ))
+
     def _new_order_oco_sell(
             self,
             symbol: str,
@@ -351,17 +833,39 @@ class Binance(Exchange):
             stop_limit_client_id: str,
             stop_limit_price: float | None = None,
     ):
-        self.client.create_oco_order(
+        self._request('create_oco_order', orders=2, priority=RateLimiter.PRIORITY_ORDER, **self._params_oco(
             symbol=symbol,
             side=BinanceClient.SIDE_SELL,
-            stopPrice=self._round_price(symbol=symbol, price=stop_price),
-            stopLimitPrice=self._round_price(symbol=symbol, price=stop_limit_price),
-            quantity=self._round_lot(symbol=symbol, quantity=quantity),
-            price=self._round_price(symbol=symbol, price=price),
-            stopLimitTimeInForce=BinanceClient.TIME_IN_FORCE_GTC,
-            limitClientOrderId=limit_client_id,
-            stopClientOrderId=stop_limit_client_id,
-        )
+            quantity=quantity,
+            price=price,
+            stop_price=stop_price,
+            limit_client_id=limit_client_id,
+            stop_limit_client_id=stop_limit_client_id,
+            stop_limit_price=stop_limit_price,
+        ))
+
+    async def _anew_order_oco_sell(
+            self,
+            symbol: str,
+            quantity: float,
+            price: float,
+            stop_price: float,
+            limit_client_id: str,
+            stop_limit_client_id: str,
+            stop_limit_price: float | None = None,
+    ):
+        symbol_info = await self.aget_symbol(symbol=symbol)
+        await self._arequest('create_oco_order', orders=2, priority=RateLimiter.PRIORITY_ORDER, **self._params_oco(
+            symbol=symbol,
+            symbol_info=symbol_info,
+            side=BinanceClient.SIDE_SELL,
+            quantity=quantity,
+            price=price,
+            stop_price=stop_price,
+            limit_client_id=limit_client_id,
+            stop_limit_client_id=stop_limit_client_id,
+            stop_limit_price=stop_limit_price,
+        ))
 
     # STOP_LOSS_LIMIT
     def _new_order_stop_up_limit_buy(
@@ -372,16 +876,35 @@ class Binance(Exchange):
             price: float,
             client_id: str
     ):
-        self.client.create_order(
+        self._request('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_stop_limit(
             symbol=symbol,
             side=BinanceClient.SIDE_BUY,
-            type=BinanceClient.ORDER_TYPE_STOP_LOSS_LIMIT,
-            timeInForce=BinanceClient.TIME_IN_FORCE_GTC,
-            quantity=self._round_lot(symbol=symbol, quantity=quantity),
-            price=self._round_price(symbol=symbol, price=price),
-            stopPrice=self._round_price(symbol=symbol, price=stop_price),
-            newClientOrderId=client_id
-        )
+            order_type=BinanceClient.ORDER_TYPE_STOP_LOSS_LIMIT,
+            quantity=quantity,
+            stop_price=stop_price,
+            price=price,
+            client_id=client_id
+        ))
+
+    async def _anew_order_stop_up_limit_buy(
+            self,
+            symbol: str,
+            quantity: float,
+            stop_price: float,
+            price: float,
+            client_id: str
+    ):
+        symbol_info = await self.aget_symbol(symbol=symbol)
+        await self._arequest('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_stop_limit(
+            symbol=symbol,
+            symbol_info=symbol_info,
+            side=BinanceClient.SIDE_BUY,
+            order_type=BinanceClient.ORDER_TYPE_STOP_LOSS_LIMIT,
+            quantity=quantity,
+            stop_price=stop_price,
+            price=price,
+            client_id=client_id
+        ))
 
     # TAKE_PROFIT_LIMIT
     def _new_order_stop_down_limit_buy(
@@ -392,16 +915,35 @@ class Binance(Exchange):
             price: float,
             client_id: str
     ):
-        self.client.create_order(
+        self._request('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_stop_limit(
             symbol=symbol,
             side=BinanceClient.SIDE_BUY,
-            type=BinanceClient.ORDER_TYPE_TAKE_PROFIT_LIMIT,
-            timeInForce=BinanceClient.TIME_IN_FORCE_GTC,
-            quantity=self._round_lot(symbol=symbol, quantity=quantity),
-            price=self._round_price(symbol=symbol, price=price),
-            stopPrice=self._round_price(symbol=symbol, price=stop_price),
-            newClientOrderId=client_id
-        )
+            order_type=BinanceClient.ORDER_TYPE_TAKE_PROFIT_LIMIT,
+            quantity=quantity,
+            stop_price=stop_price,
+            price=price,
+            client_id=client_id
+        ))
+
+    async def _anew_order_stop_down_limit_buy(
+            self,
+            symbol: str,
+            quantity: float,
+            stop_price: float,
+            price: float,
+            client_id: str
+    ):
+        symbol_info = await self.aget_symbol(symbol=symbol)
+        await self._arequest('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_stop_limit(
+            symbol=symbol,
+            symbol_info=symbol_info,
+            side=BinanceClient.SIDE_BUY,
+            order_type=BinanceClient.ORDER_TYPE_TAKE_PROFIT_LIMIT,
+            quantity=quantity,
+            stop_price=stop_price,
+            price=price,
+            client_id=client_id
+        ))
 
     # STOP LOSS LIMIT
     def _new_order_stop_down_limit_sell(
@@ -412,13 +954,32 @@ class Binance(Exchange):
             price: float,
             client_id: str
     ):
-        self.client.create_order(
+        self._request('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_stop_limit(
             symbol=symbol,
             side=BinanceClient.SIDE_SELL,
-            type=BinanceClient.ORDER_TYPE_STOP_LOSS_LIMIT,
-            timeInForce=BinanceClient.TIME_IN_FORCE_GTC,
-            quantity=self._round_lot(symbol=symbol, quantity=quantity),
-            price=self._round_price(symbol=symbol, price=price),
-            stopPrice=self._round_price(symbol=symbol, price=stop_price),
-            newClientOrderId=client_id
-        )
\ No newline at end of file
+            order_type=BinanceClient.ORDER_TYPE_STOP_LOSS_LIMIT,
+            quantity=quantity,
+            stop_price=stop_price,
+            price=price,
+            client_id=client_id
+        ))
+
+    async def _anew_order_stop_down_limit_sell(
+            self,
+            symbol: str,
+            quantity: float,
+            stop_price: float,
+            price: float,
+            client_id: str
+    ):
+        symbol_info = await self.aget_symbol(symbol=symbol)
+        await self._arequest('create_order', orders=1, priority=RateLimiter.PRIORITY_ORDER, **self._params_stop_limit(
+            symbol=symbol,
+            symbol_info=symbol_info,
+            side=BinanceClient.SIDE_SELL,
+            order_type=BinanceClient.ORDER_TYPE_STOP_LOSS_LIMIT,
+            quantity=quantity,
+            stop_price=stop_price,
+            price=price,
+            client_id=client_id
+        ))
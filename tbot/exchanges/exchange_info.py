@@ -0,0 +1,39 @@
+import json
+import zlib
+from binance.client import Client
+from lib import cached
+
+# Fields of symbols of exchange info, which are used by the project
+SYMBOL_FIELDS = ('symbol', 'baseAsset', 'quoteAsset', 'status', 'ocoAllowed', 'isSpotTradingAllowed')
+
+
+def parse_symbol_info(symbol_info: dict) -> dict:
+    """
+    Compact copy of symbol of exchange info, filters are dict by filterType
+    """
+    result = {name: symbol_info.get(name) for name in SYMBOL_FIELDS}
+    result['filters'] = {_filter['filterType']: _filter for _filter in symbol_info.get('filters', [])}
+    return result
+
+
+@cached('binance_exchange_info', 15 * 60, local_size=1)
+def get_binance_exchange_info() -> dict:
+    """
+    Symbols of Binance exchange info. The payload is downloaded not often than once in 15 minutes by all processes.
+
+    Returns dict:
+        server_time - serverTime of exchange info
+        fingerprint - checksum of symbols, it is changed only when symbols are changed
+        symbols - list of parse_symbol_info() results
+    """
+    info = Client().get_exchange_info()
+    symbols = [parse_symbol_info(symbol_info) for symbol_info in info['symbols']]
+    return {
+        'server_time': info.get('serverTime'),
+        'fingerprint': '%08x' % zlib.crc32(json.dumps(symbols, sort_keys=True).encode()),
+        'symbols': symbols,
+    }
+
+
+def get_filter(symbol_info: dict, filter_name: str, filter_param: str):
+    return symbol_info['filters'].get(filter_name, {}).get(filter_param)
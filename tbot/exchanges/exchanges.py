@@ -2,14 +2,22 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 import re
 import sys
+import asyncio
 from datetime import datetime
+from decimal import Decimal
+from asgiref.sync import sync_to_async, async_to_sync
 from django.utils import timezone
 # project level
 from django.conf import settings
+from django.db import connection as db_connection, transaction
+from django.db.models import Case, F, Value, When
 from lib import rabbitmq, print_object
 # application level
-from tbot.dto import ExchangeConnectionWorkerCommands, ExchangeConnectionWorkerCommand
+from tbot.dto import ExchangeConnectionWorkerCommands, ExchangeConnectionWorkerCommand, OrderStatusUpdate
+from tbot.dto import OrderCallbackJob
 from tbot.models import ExchangeConnection, Symbol, ExchangesNames, Order, Position
+from tbot.models import fill_order_owners, mark_connections_active, refresh_connections_active
+from tbot.symbols import SymbolInfo, SymbolRegistry
 
 
 def _create_order(**kwargs) -> Order:
@@ -18,6 +26,60 @@ def _create_order(**kwargs) -> Order:
     return order
 
 
+def _create_oco_orders(limit: dict, stop_limit: dict) -> (Order, Order):
+    order_limit = _create_order(**limit)
+    order_stop_limit = _create_order(oco_order=order_limit, **stop_limit)
+
+    order_limit.oco_order = order_stop_limit
+    order_limit.save()
+
+    return order_limit, order_stop_limit
+
+
+# Results of _bulk_insert_ids_consecutive() by database alias
+_consecutive_ids = {}
+
+
+def _bulk_insert_ids_consecutive() -> bool:
+    """
+    Ids of one multi-row INSERT are consecutive only with innodb_autoinc_lock_mode 0 or 1
+    (look docker/mysql/mysqld.cnf) and auto_increment_increment 1. Server settings are checked once per process
+    """
+    alias = db_connection.alias
+    if alias not in _consecutive_ids:
+        with db_connection.cursor() as cursor:
+            cursor.execute('SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment')
+            lock_mode, increment = cursor.fetchone()
+        _consecutive_ids[alias] = int(lock_mode) in (0, 1) and int(increment) == 1
+        if not _consecutive_ids[alias]:
+            print("Orders are inserted one by one: innodb_autoinc_lock_mode=" + str(lock_mode) +
+                  ", auto_increment_increment=" + str(increment), file=sys.stderr)
+    return _consecutive_ids[alias]
+
+
+def _bulk_create_orders(orders: list[Order], exchange_connection_id: int) -> list[Order]:
+    # MySQL doesn't return ids of rows inserted by bulk INSERT, but when ids of one multi-row INSERT
+    # are consecutive, LAST_INSERT_ID() returns the first of them
+    # bulk_create doesn't send pre_save signal, and owners are set before save() of the fallback, so it doesn't
+    # look them up for every order
+    for order in orders:
+        order.exchange_connection_id = exchange_connection_id
+    fill_order_owners(orders)
+    with transaction.atomic():
+        if _bulk_insert_ids_consecutive():
+            Order.objects.bulk_create(orders)
+            with db_connection.cursor() as cursor:
+                cursor.execute('SELECT LAST_INSERT_ID()')
+                first_id = cursor.fetchone()[0]
+            for i, order in enumerate(orders):
+                order.id = first_id + i
+        else:
+            for order in orders:
+                order.save()
+    mark_connections_active({order.exchange_connection_id for order in orders})
+    return orders
+
+
 class Exchange(ABC):
     exchange: ExchangesNames
     _instances = {}
@@ -45,15 +107,20 @@ class Exchange(ABC):
 
     def __init__(self, connection: ExchangeConnection):
         self.exchange_connection = connection
-        self._symbols = {}
 
-    def get_symbol(self, symbol: str, cached=True) -> Symbol:
-        if symbol not in self._symbols or not cached:
-            self._symbols[symbol] = Symbol.objects.get(exchange=self.exchange_connection.exchange, symbol=symbol)
-        return self._symbols[symbol]
+    def get_symbol(self, symbol: str, cached=True) -> SymbolInfo:
+        if not cached:
+            self.clear_symbols_cache()
+        return SymbolRegistry.get(exchange=self.exchange_connection.exchange, symbol=symbol)
+
+    async def aget_symbol(self, symbol: str) -> SymbolInfo:
+        info = SymbolRegistry.get_loaded(exchange=self.exchange_connection.exchange, symbol=symbol)
+        if info is None:
+            info = await sync_to_async(self.get_symbol, thread_sensitive=True)(symbol=symbol)
+        return info
 
     def clear_symbols_cache(self):
-        self._symbols = {}
+        SymbolRegistry.invalidate(exchange=self.exchange_connection.exchange)
 
     @abstractmethod
     def get_asset_balance(self, asset: str, calc_free=True, calc_locked=False):
@@ -73,9 +140,20 @@ class Exchange(ABC):
 
     @classmethod
     def on_error_order(cls, order):
-        order.status = order.Statuses.ERROR
-        order.save()
-        print_object(order, file=sys.stderr)
+        cls.on_error_orders(orders=[order])
+
+    @classmethod
+    def on_error_orders(cls, orders: list[Order]):
+        if not orders:
+            return
+        Order.objects.filter(id__in=[order.id for order in orders]).update(
+            status=Order.Statuses.ERROR,
+            updated_at=datetime.now(tz=timezone.utc)
+        )
+        for order in orders:
+            order.status = order.Statuses.ERROR
+            print_object(order, file=sys.stderr)
+        refresh_connections_active({order.exchange_connection_id for order in orders})
 
     def new_order_market_buy(
             self,
@@ -350,31 +428,80 @@ class Exchange(ABC):
     ):
         pass
 
+    @staticmethod
+    def _prepare_cancel_orders(orders: list[Order]) -> list[tuple[Order, str]]:
+        """
+        Marks callbacks of active orders (and their OCO pairs) as canceled by one UPDATE.
+        Returns active orders with their symbols, orders which are not active anymore are skipped
+        """
+        if not orders:
+            return []
+        # Symbols are read by the join path, denormalized bot may be not filled for old orders.
+        # They are read without lock, because FOR UPDATE of MySQL 5.7 would lock all joined rows
+        symbols = dict(Order.objects.filter(id__in=[order.id for order in orders]).values_list(
+            'id',
+            'position__round__bot__symbol__symbol'
+        ))
+        with transaction.atomic():
+            # Rows are locked, so user data stream can't change statuses between SELECT and UPDATE
+            active = {
+                order_id: (oco_order_id, symbols[order_id])
+                for order_id, oco_order_id in Order.objects.select_for_update().filter(
+                    id__in=list(symbols.keys()),
+                    status=Order.Statuses.ACTIVE
+                ).values_list('id', 'oco_order_id')
+            }
+            if not active:
+                return []
+            ids = set(active.keys()) | {oco_order_id for oco_order_id, _ in active.values() if oco_order_id}
+            Order.objects.filter(id__in=ids).update(callback_status=Order.CallbackStatuses.CANCELED)
+
+        result = []
+        for order in orders:
+            if order.id not in active:
+                continue
+            order.callback_status = Order.CallbackStatuses.CANCELED
+            if order.oco_order_id and Order.oco_order.is_cached(order):
+                order.oco_order.callback_status = Order.CallbackStatuses.CANCELED
+            result.append((order, active[order.id][1]))
+        return result
+
+    @classmethod
+    def _prepare_cancel_order(cls, order: Order) -> str | None:
+        """
+        Returns symbol of the order or None, if order is not active anymore
+        """
+        prepared = cls._prepare_cancel_orders(orders=[order])
+        return prepared[0][1] if prepared else None
+
     def cancel_order(self, order: Order):
         # TODO Stop user-stream worker if it not needed
 
-        reloaded_order = Order.objects.get(id=order.id)
-        if reloaded_order.status != order.Statuses.ACTIVE:
+        symbol = self._prepare_cancel_order(order=order)
+        if symbol is None:
             return
 
-        if order.oco_order is not None:
-            order.oco_order.callback_status = Order.CallbackStatuses.CANCELED
-            order.oco_order.save()
-
-        order.callback_status = order.CallbackStatuses.CANCELED
-        order.save()
-
         self._cancel_order(
-            symbol=order.position.round.bot.symbol.symbol,
+            symbol=symbol,
             client_id=self.order_encode_id(order.id)
         )
 
+    def cancel_orders(self, orders: list[Order], concurrency: int | None = None) -> list[Order]:
+        """
+        Cancels many orders: statuses are checked and callbacks are marked by one transaction,
+        requests to exchange are sent concurrently. Returns orders, which were active
+        """
+        return self._run_async(self.acancel_orders, orders=orders, concurrency=concurrency)
+
     @abstractmethod
     def _cancel_order(self, symbol: str, client_id: str):
         pass
 
     @classmethod
     def to_float(cls, number):
+        if isinstance(number, Decimal):
+            # Values of FixedPointField are already on the grid of 10 ** -8
+            return float(number)
         return float(round(number, 8))
 
     def new_order_oco_buy(
@@ -390,35 +517,30 @@ class Exchange(ABC):
             position_key_limit: str = '',
             position_key_stop_limit: str = '',
     ):
-        order_limit = Order(
-            position=position,
-            type=Order.Types.LIMIT_MAKER,
-            side=Order.Sides.BUY,
-            quantity=quantity,
-            price=price,
-            callback=callback_limit,
-            position_key=position_key_limit,
-        )
-        order_limit.save()
-
         if stop_limit_price is None:
             stop_limit_price = self.to_float(stop_price * 1.1)
 
-        order_stop_limit = Order(
-            position=position,
-            type=Order.Types.STOP_LOSS_LIMIT,
-            side=Order.Sides.BUY,
-            quantity=self.to_float(quantity),
-            price=stop_limit_price,
-            stop_price=stop_price,
-            callback=callback_stop_limit,
-            oco_order=order_limit,
-            position_key=position_key_stop_limit,
+        order_limit, order_stop_limit = _create_oco_orders(
+            limit=dict(
+                position=position,
+                type=Order.Types.LIMIT_MAKER,
+                side=Order.Sides.BUY,
+                quantity=quantity,
+                price=price,
+                callback=callback_limit,
+                position_key=position_key_limit,
+            ),
+            stop_limit=dict(
+                position=position,
+                type=Order.Types.STOP_LOSS_LIMIT,
+                side=Order.Sides.BUY,
+                quantity=self.to_float(quantity),
+                price=stop_limit_price,
+                stop_price=stop_price,
+                callback=callback_stop_limit,
+                position_key=position_key_stop_limit,
+            ),
         )
-        order_stop_limit.save()
-
-        order_limit.oco_order = order_stop_limit
-        order_limit.save()
 
         try:
             self._new_order_oco_buy(
@@ -461,35 +583,30 @@ class Exchange(ABC):
             position_key_limit: str = '',
             position_key_stop_limit: str = '',
     ):
-        order_limit = Order(
-            position=position,
-            quantity=quantity,
-            type=Order.Types.LIMIT_MAKER,
-            side=Order.Sides.SELL,
-            price=price,
-            callback=callback_limit,
-            position_key=position_key_limit,
-        )
-        order_limit.save()
-
         if stop_limit_price is None:
             stop_limit_price = stop_price * 0.9
 
-        order_stop_limit = Order(
-            type=Order.Types.STOP_LOSS_LIMIT,
-            side=Order.Sides.SELL,
-            position=position,
-            quantity=quantity,
-            price=stop_limit_price,
-            stop_price=stop_price,
-            callback=callback_stop_limit,
-            oco_order=order_limit,
-            position_key=position_key_stop_limit,
+        order_limit, order_stop_limit = _create_oco_orders(
+            limit=dict(
+                position=position,
+                quantity=quantity,
+                type=Order.Types.LIMIT_MAKER,
+                side=Order.Sides.SELL,
+                price=price,
+                callback=callback_limit,
+                position_key=position_key_limit,
+            ),
+            stop_limit=dict(
+                type=Order.Types.STOP_LOSS_LIMIT,
+                side=Order.Sides.SELL,
+                position=position,
+                quantity=quantity,
+                price=stop_limit_price,
+                stop_price=stop_price,
+                callback=callback_stop_limit,
+                position_key=position_key_stop_limit,
+            ),
         )
-        order_stop_limit.save()
-
-        order_limit.oco_order = order_stop_limit
-        order_limit.save()
 
         try:
             self._new_order_oco_sell(
@@ -519,17 +636,629 @@ class Exchange(ABC):
     ):
         pass
 
-    def user_data_stream_command(self, command: str):
-        command_body = ExchangeConnectionWorkerCommand(
+    # Asyncio API.
+    # Mirrors blocking new_order_*/cancel_order methods, so many orders can be sent concurrently, for example:
+    #   await asyncio.gather(*[exchange.anew_order_limit_buy(...) for ... in grid])
+    # Exchanges without native async client fall back to blocking _new_order_* methods, executed in a thread.
+
+    async def _aplace_order(self, orders: list[Order], func, **kwargs):
+        try:
+            await func(**kwargs)
+        except BaseException as e:
+            await sync_to_async(self.on_error_orders, thread_sensitive=True)(orders=orders)
+            raise e
+
+    async def anew_order_market_buy(
+            self,
+            symbol: Symbol,
+            position: Position,
+            quote_quantity: float,
+            callback: str = '',
+            position_key: str = '',
+    ) -> Order:
+        order = await sync_to_async(_create_order, thread_sensitive=True)(
+            position=position,
+            type=Order.Types.MARKET,
+            side=Order.Sides.BUY,
+            quote_quantity=quote_quantity,
+            callback=callback,
+            position_key=position_key,
+        )
+        await self._aplace_order(
+            [order],
+            self._anew_order_market_buy,
+            symbol=symbol.symbol,
+            quote_quantity=self.to_float(quote_quantity),
+            client_id=self.order_encode_id(order_id=order.id)
+        )
+        return order
+
+    async def _anew_order_market_buy(self, symbol: str, quote_quantity: float, client_id: str):
+        await sync_to_async(self._new_order_market_buy, thread_sensitive=True)(
+            symbol=symbol, quote_quantity=quote_quantity, client_id=client_id
+        )
+
+    async def anew_order_market_sell(
+            self,
+            symbol: Symbol,
+            position: Position,
+            quantity: float,
+            callback: str = '',
+            position_key: str = '',
+    ) -> Order:
+        order = await sync_to_async(_create_order, thread_sensitive=True)(
+            position=position,
+            type=Order.Types.MARKET,
+            side=Order.Sides.SELL,
+            quantity=quantity,
+            callback=callback,
+            position_key=position_key,
+        )
+        await self._aplace_order(
+            [order],
+            self._anew_order_market_sell,
+            symbol=symbol.symbol,
+            quantity=self.to_float(quantity),
+            client_id=self.order_encode_id(order_id=order.id)
+        )
+        return order
+
+    async def _anew_order_market_sell(self, symbol: str, quantity: float, client_id: str):
+        await sync_to_async(self._new_order_market_sell, thread_sensitive=True)(
+            symbol=symbol, quantity=quantity, client_id=client_id
+        )
+
+    async def anew_order_limit_buy(
+            self,
+            symbol: Symbol,
+            position: Position,
+            quantity: float,
+            price: float,
+            callback: str = '',
+            position_key: str = '',
+    ) -> Order:
+        order = await sync_to_async(_create_order, thread_sensitive=True)(
+            position=position,
+            type=Order.Types.LIMIT,
+            side=Order.Sides.BUY,
+            quantity=quantity,
+            price=price,
+            callback=callback,
+            position_key=position_key,
+        )
+        await self._aplace_order(
+            [order],
+            self._anew_order_limit_buy,
+            symbol=symbol.symbol,
+            quantity=self.to_float(quantity),
+            price=self.to_float(price),
+            client_id=self.order_encode_id(order_id=order.id)
+        )
+        return order
+
+    async def _anew_order_limit_buy(self, symbol: str, quantity: float, price: float, client_id: str):
+        await sync_to_async(self._new_order_limit_buy, thread_sensitive=True)(
+            symbol=symbol, quantity=quantity, price=price, client_id=client_id
+        )
+
+    async def anew_order_limit_sell(
+            self,
+            symbol: Symbol,
+            position: Position,
+            quantity: float,
+            price: float,
+            callback: str = '',
+            position_key: str = '',
+    ) -> Order:
+        order = await sync_to_async(_create_order, thread_sensitive=True)(
+            position=position,
+            quantity=quantity,
+            price=price,
+            type=Order.Types.LIMIT,
+            side=Order.Sides.SELL,
+            callback=callback,
+            position_key=position_key,
+        )
+        await self._aplace_order(
+            [order],
+            self._anew_order_limit_sell,
+            symbol=symbol.symbol,
+            quantity=self.to_float(quantity),
+            price=self.to_float(price),
+            client_id=self.order_encode_id(order_id=order.id)
+        )
+        return order
+
+    async def _anew_order_limit_sell(self, symbol: str, quantity: float, price: float, client_id: str):
+        await sync_to_async(self._new_order_limit_sell, thread_sensitive=True)(
+            symbol=symbol, quantity=quantity, price=price, client_id=client_id
+        )
+
+    async def anew_order_stop_down_limit_sell(
+            self,
+            symbol: Symbol,
+            position: Position,
+            quantity: float,
+            stop_price: float,
+            callback: str = '',
+            price: float | None = None,
+            position_key: str = '',
+    ) -> Order:
+        if price is None:
+            price = self.to_float(stop_price * 0.9)
+
+        order = await sync_to_async(_create_order, thread_sensitive=True)(
+            position=position,
+            type=Order.Types.STOP_LOSS_LIMIT,
+            side=Order.Sides.SELL,
+            quantity=quantity,
+            price=price,
+            stop_price=stop_price,
+            callback=callback,
+            position_key=position_key,
+        )
+        await self._aplace_order(
+            [order],
+            self._anew_order_stop_down_limit_sell,
+            symbol=symbol.symbol,
+            quantity=self.to_float(quantity),
+            price=self.to_float(price),
+            stop_price=stop_price,
+            client_id=self.order_encode_id(order_id=order.id)
+        )
+        return order
+
+    async def _anew_order_stop_down_limit_sell(
+            self,
+            symbol: str,
+            quantity: float,
+            stop_price: float,
+            price: float,
+            client_id: str
+    ):
+        await sync_to_async(self._new_order_stop_down_limit_sell, thread_sensitive=True)(
+            symbol=symbol, quantity=quantity, stop_price=stop_price, price=price, client_id=client_id
+        )
+
+    async def anew_order_stop_up_limit_buy(
+            self,
+            symbol: Symbol,
+            position: Position,
+            quantity: float,
+            stop_price: float,
+            callback: str = '',
+            price: float | None = None,
+            position_key: str = '',
+    ) -> Order:
+        if price is None:
+            price = self.to_float(stop_price * 1.1)
+
+        order = await sync_to_async(_create_order, thread_sensitive=True)(
+            position=position,
+            type=Order.Types.STOP_LOSS_LIMIT,
+            side=Order.Sides.BUY,
+            quantity=quantity,
+            price=price,
+            stop_price=stop_price,
+            callback=callback,
+            position_key=position_key,
+        )
+        await self._aplace_order(
+            [order],
+            self._anew_order_stop_up_limit_buy,
+            symbol=symbol.symbol,
+            quantity=self.to_float(quantity),
+            price=self.to_float(price),
+            stop_price=stop_price,
+            client_id=self.order_encode_id(order_id=order.id)
+        )
+        return order
+
+    async def _anew_order_stop_up_limit_buy(
+            self,
+            symbol: str,
+            quantity: float,
+            stop_price: float,
+            price: float,
+            client_id: str
+    ):
+        await sync_to_async(self._new_order_stop_up_limit_buy, thread_sensitive=True)(
+            symbol=symbol, quantity=quantity, stop_price=stop_price, price=price, client_id=client_id
+        )
+
+    async def anew_order_stop_down_limit_buy(
+            self,
+            symbol: Symbol,
+            position: Position,
+            quantity: float,
+            stop_price: float,
+            callback: str = '',
+            price: float | None = None,
+            position_key: str = '',
+    ) -> Order:
+        if price is None:
+            price = self.to_float(stop_price * 1.1)
+
+        order = await sync_to_async(_create_order, thread_sensitive=True)(
+            position=position,
+            quantity=quantity,
+            price=price,
+            stop_price=stop_price,
+            callback=callback,
+            type=Order.Types.TAKE_PROFIT_LIMIT,
+            side=Order.Sides.BUY,
+            position_key=position_key,
+        )
+        await self._aplace_order(
+            [order],
+            self._anew_order_stop_down_limit_buy,
+            symbol=symbol.symbol,
+            quantity=quantity,
+            price=self.to_float(price),
+            stop_price=self.to_float(stop_price),
+            client_id=self.order_encode_id(order_id=order.id)
+        )
+        return order
+
+    async def _anew_order_stop_down_limit_buy(
+            self,
+            symbol: str,
+            quantity: float,
+            stop_price: float,
+            price: float,
+            client_id: str
+    ):
+        await sync_to_async(self._new_order_stop_down_limit_buy, thread_sensitive=True)(
+            symbol=symbol, quantity=quantity, stop_price=stop_price, price=price, client_id=client_id
+        )
+
+    async def anew_order_oco_buy(
+            self,
+            symbol: Symbol,
+            position: Position,
+            quantity: float,
+            price: float,
+            stop_price: float,
+            callback_limit: str = '',
+            callback_stop_limit: str = '',
+            stop_limit_price: float | None = None,
+            position_key_limit: str = '',
+            position_key_stop_limit: str = '',
+    ) -> (Order, Order):
+        if stop_limit_price is None:
+            stop_limit_price = self.to_float(stop_price * 1.1)
+
+        order_limit, order_stop_limit = await sync_to_async(_create_oco_orders, thread_sensitive=True)(
+            limit=dict(
+                position=position,
+                type=Order.Types.LIMIT_MAKER,
+                side=Order.Sides.BUY,
+                quantity=quantity,
+                price=price,
+                callback=callback_limit,
+                position_key=position_key_limit,
+            ),
+            stop_limit=dict(
+                position=position,
+                type=Order.Types.STOP_LOSS_LIMIT,
+                side=Order.Sides.BUY,
+                quantity=self.to_float(quantity),
+                price=stop_limit_price,
+                stop_price=stop_price,
+                callback=callback_stop_limit,
+                position_key=position_key_stop_limit,
+            ),
+        )
+        await self._aplace_order(
+            [order_limit, order_stop_limit],
+            self._anew_order_oco_buy,
+            symbol=symbol.symbol,
+            quantity=self.to_float(quantity),
+            price=self.to_float(price),
+            stop_price=self.to_float(stop_price),
+            stop_limit_price=self.to_float(stop_limit_price),
+            limit_client_id=self.order_encode_id(order_id=order_limit.id),
+            stop_limit_client_id=self.order_encode_id(order_id=order_stop_limit.id),
+        )
+        return order_limit, order_stop_limit
+
+    async def _anew_order_oco_buy(
+            self,
+            symbol: str,
+            quantity: float,
+            price: float,
+            stop_price: float,
+            limit_client_id: str,
+            stop_limit_client_id: str,
+            stop_limit_price: float | None = None,
+    ):
+        await sync_to_async(self._new_order_oco_buy, thread_sensitive=True)(
+            symbol=symbol,
+            quantity=quantity,
+            price=price,
+            stop_price=stop_price,
+            limit_client_id=limit_client_id,
+            stop_limit_client_id=stop_limit_client_id,
+            stop_limit_price=stop_limit_price,
+        )
+
+    async def anew_order_oco_sell(
+            self,
+            symbol: Symbol,
+            position: Position,
+            quantity: float,
+            price: float,
+            stop_price: float,
+            callback_limit: str = '',
+            callback_stop_limit: str = '',
+            stop_limit_price: float | None = None,
+            position_key_limit: str = '',
+            position_key_stop_limit: str = '',
+    ) -> (Order, Order):
+        if stop_limit_price is None:
+            stop_limit_price = stop_price * 0.9
+
+        order_limit, order_stop_limit = await sync_to_async(_create_oco_orders, thread_sensitive=True)(
+            limit=dict(
+                position=position,
+                quantity=quantity,
+                type=Order.Types.LIMIT_MAKER,
+                side=Order.Sides.SELL,
+                price=price,
+                callback=callback_limit,
+                position_key=position_key_limit,
+            ),
+            stop_limit=dict(
+                type=Order.Types.STOP_LOSS_LIMIT,
+                side=Order.Sides.SELL,
+                position=position,
+                quantity=quantity,
+                price=stop_limit_price,
+                stop_price=stop_price,
+                callback=callback_stop_limit,
+                position_key=position_key_stop_limit,
+            ),
+        )
+        await self._aplace_order(
+            [order_limit, order_stop_limit],
+            self._anew_order_oco_sell,
+            symbol=symbol.symbol,
+            quantity=self.to_float(quantity),
+            price=self.to_float(price),
+            stop_price=self.to_float(stop_price),
+            stop_limit_price=self.to_float(stop_limit_price),
+            limit_client_id=self.order_encode_id(order_id=order_limit.id),
+            stop_limit_client_id=self.order_encode_id(order_id=order_stop_limit.id),
+        )
+        return order_limit, order_stop_limit
+
+    async def _anew_order_oco_sell(
+            self,
+            symbol: str,
+            quantity: float,
+            price: float,
+            stop_price: float,
+            limit_client_id: str,
+            stop_limit_client_id: str,
+            stop_limit_price: float | None = None,
+    ):
+        await sync_to_async(self._new_order_oco_sell, thread_sensitive=True)(
+            symbol=symbol,
+            quantity=quantity,
+            price=price,
+            stop_price=stop_price,
+            limit_client_id=limit_client_id,
+            stop_limit_client_id=stop_limit_client_id,
+            stop_limit_price=stop_limit_price,
+        )
+
+    _batch_order_kinds = [
+        (Order.Types.MARKET, Order.Sides.BUY),
+        (Order.Types.MARKET, Order.Sides.SELL),
+        (Order.Types.LIMIT, Order.Sides.BUY),
+        (Order.Types.LIMIT, Order.Sides.SELL),
+        (Order.Types.STOP_LOSS_LIMIT, Order.Sides.SELL),
+        (Order.Types.STOP_LOSS_LIMIT, Order.Sides.BUY),
+        (Order.Types.TAKE_PROFIT_LIMIT, Order.Sides.BUY),
+    ]
+
+    async def _anew_order(self, symbol: str, order: Order):
+        client_id = self.order_encode_id(order_id=order.id)
+        match order.type, order.side:
+            case Order.Types.MARKET, Order.Sides.BUY:
+                await self._anew_order_market_buy(
+                    symbol=symbol,
+                    quote_quantity=self.to_float(order.quote_quantity),
+                    client_id=client_id
+                )
+            case Order.Types.MARKET, Order.Sides.SELL:
+                await self._anew_order_market_sell(
+                    symbol=symbol,
+                    quantity=self.to_float(order.quantity),
+                    client_id=client_id
+                )
+            case Order.Types.LIMIT, Order.Sides.BUY:
+                await self._anew_order_limit_buy(
+                    symbol=symbol,
+                    quantity=self.to_float(order.quantity),
+                    price=self.to_float(order.price),
+                    client_id=client_id
+                )
+            case Order.Types.LIMIT, Order.Sides.SELL:
+                await self._anew_order_limit_sell(
+                    symbol=symbol,
+                    quantity=self.to_float(order.quantity),
+                    price=self.to_float(order.price),
+                    client_id=client_id
+                )
+            case Order.Types.STOP_LOSS_LIMIT, Order.Sides.SELL:
+                await self._anew_order_stop_down_limit_sell(
+                    symbol=symbol,
+                    quantity=self.to_float(order.quantity),
+                    price=self.to_float(order.price),
+                    stop_price=self.to_float(order.stop_price),
+                    client_id=client_id
+                )
+            case Order.Types.STOP_LOSS_LIMIT, Order.Sides.BUY:
+                await self._anew_order_stop_up_limit_buy(
+                    symbol=symbol,
+                    quantity=self.to_float(order.quantity),
+                    price=self.to_float(order.price),
+                    stop_price=self.to_float(order.stop_price),
+                    client_id=client_id
+                )
+            case Order.Types.TAKE_PROFIT_LIMIT, Order.Sides.BUY:
+                await self._anew_order_stop_down_limit_buy(
+                    symbol=symbol,
+                    quantity=self.to_float(order.quantity),
+                    price=self.to_float(order.price),
+                    stop_price=self.to_float(order.stop_price),
+                    client_id=client_id
+                )
+
+    async def anew_orders_batch(
+            self,
+            symbol: Symbol,
+            orders: list[Order],
+            concurrency: int | None = None
+    ) -> list[Order]:
+        """
+        Places a batch of orders (for example a grid): all rows are created by one bulk INSERT,
+        requests to exchange are sent concurrently, failed orders are marked as ERROR by one UPDATE.
+
+        :param Symbol symbol: Symbol of all orders
+        :param list orders: Not saved Order instances with position, type, side and type specific
+            quantity/quote_quantity/price/stop_price. OCO orders are not supported.
+        :param int concurrency: Max number of simultaneous requests to exchange,
+            defaults to settings.EXCHANGE_BATCH_CONCURRENCY
+        """
+        for order in orders:
+            if (order.type, order.side) not in self._batch_order_kinds:
+                raise ValueError("Order " + str(order.type) + " " + str(order.side) + " can't be placed in batch")
+
+        if concurrency is None:
+            concurrency = settings.EXCHANGE_BATCH_CONCURRENCY
+
+        await sync_to_async(_bulk_create_orders, thread_sensitive=True)(
+            orders=orders,
+            exchange_connection_id=self.exchange_connection.id
+        )
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def place(_order: Order):
+            async with semaphore:
+                await self._anew_order(symbol=symbol.symbol, order=_order)
+
+        results = await asyncio.gather(*[place(_order=order) for order in orders], return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            await sync_to_async(self.on_error_orders, thread_sensitive=True)(
+                orders=[order for order, result in zip(orders, results) if isinstance(result, BaseException)]
+            )
+            raise errors[0]
+
+        return orders
+
+    def _run_async(self, func, **kwargs):
+        """
+        Runs coroutine function of asyncio API from blocking code.
+
+        If the caller runs under sync_to_async, asgiref executes the coroutine in the caller's loop, which may
+        use its async client (user data stream). So the client is closed only if it is created by this call.
+        """
+        async def run():
+            created = not self.has_async_client()
+            try:
+                return await func(**kwargs)
+            finally:
+                if created:
+                    await self.aclose()
+
+        return async_to_sync(run)()
+
+    def new_orders_batch(self, symbol: Symbol, orders: list[Order], concurrency: int | None = None) -> list[Order]:
+        return self._run_async(self.anew_orders_batch, symbol=symbol, orders=orders, concurrency=concurrency)
+
+    async def acancel_order(self, order: Order):
+        symbol = await sync_to_async(self._prepare_cancel_order, thread_sensitive=True)(order=order)
+        if symbol is None:
+            return
+
+        await self._acancel_order(
+            symbol=symbol,
+            client_id=self.order_encode_id(order.id)
+        )
+
+    async def acancel_orders(self, orders: list[Order], concurrency: int | None = None) -> list[Order]:
+        """
+        :param list orders: Orders of any symbols, only active of them are canceled
+        :param int concurrency: Max number of simultaneous requests to exchange,
+            defaults to settings.EXCHANGE_BATCH_CONCURRENCY
+        """
+        prepared = await sync_to_async(self._prepare_cancel_orders, thread_sensitive=True)(orders=orders)
+
+        if concurrency is None:
+            concurrency = settings.EXCHANGE_BATCH_CONCURRENCY
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def cancel(_order: Order, _symbol: str):
+            async with semaphore:
+                await self._acancel_order(symbol=_symbol, client_id=self.order_encode_id(_order.id))
+
+        results = await asyncio.gather(
+            *[cancel(_order=order, _symbol=symbol) for order, symbol in prepared],
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+        return [order for order, _ in prepared]
+
+    async def _acancel_order(self, symbol: str, client_id: str):
+        await sync_to_async(self._cancel_order, thread_sensitive=True)(symbol=symbol, client_id=client_id)
+
+    def has_async_client(self) -> bool:
+        """
+        Returns True, if asyncio API has open resources in the running loop
+        """
+        return False
+
+    async def aclose(self):
+        """
+        Releases resources of asyncio API (HTTP sessions etc.) of the running loop
+        """
+        pass
+
+    def user_data_stream_command_body(self, command: str) -> ExchangeConnectionWorkerCommand | None:
+        return ExchangeConnectionWorkerCommand(
             exchange_connection_id=self.exchange_connection.id,
             command=command
         )
 
+    def user_data_stream_command(self, command: str):
+        command_body = self.user_data_stream_command_body(command)
+        if command_body is None:
+            return
+
         rabbitmq.send(
             queue=settings.RABBITMQ_USER_DS_CMD_QUEUE,
             routing_key=settings.RABBITMQ_USER_DS_CMD_QUEUE,
             body=command_body)
 
+    @staticmethod
+    def user_data_streams_command(exchanges: list[Exchange], command: str):
+        """
+        Sends command to user data streams of many connections by one batch
+        """
+        bodies = [exchange.user_data_stream_command_body(command) for exchange in exchanges]
+
+        rabbitmq.send_batch(
+            queue=settings.RABBITMQ_USER_DS_CMD_QUEUE,
+            routing_key=settings.RABBITMQ_USER_DS_CMD_QUEUE,
+            bodies=[body for body in bodies if body is not None])
+
     def user_data_stream_start(self):
         self.user_data_stream_command(ExchangeConnectionWorkerCommands.START)
 
@@ -540,6 +1269,14 @@ class Exchange(ABC):
     def user_data_stream_execution(self):
         pass
 
+    @abstractmethod
+    def user_data_stream_attach(self, loop: asyncio.AbstractEventLoop, on_stop=None):
+        """
+        Starts user data stream in the event loop, shared by many connections.
+        Returns stream object with stop() method or None, if exchange has no user data streams.
+        """
+        pass
+
     @staticmethod
     def order_parse_id(order_id: str) -> int | None:
         r = re.match(r'^(\w{12})-(\d+)$', order_id)
@@ -553,35 +1290,131 @@ class Exchange(ABC):
     def order_encode_id(order_id: int) -> str:
         return settings.EXCHANGE_ORDER_PREFIX + "-" + str(order_id)
 
+    ORDER_FINAL_STATUSES = (Order.Statuses.FILLED, Order.Statuses.CANCELED, Order.Statuses.EXPIRED)
+
     @classmethod
-    def _callback_order(cls, status: Order.Statuses, order_id: int, updated_at: datetime | None = None, **kwargs):
-        order: Order = Order.objects.get(id=order_id)
-        order.status = status
-        fields = ['status']
-        for k in kwargs:
-            setattr(order, k, kwargs[k])
-            if k not in fields:
-                fields.append(k)
-
-        if updated_at is None:
-            order.save(update_fields=(fields + ['updated_at']))
-            saved = True
-        else:
-            update = {
-                'updated_at': datetime.now(tz=timezone.utc)
+    def callback_orders(cls, updates: list[OrderStatusUpdate]) -> list[Order]:
+        """
+        Applies status updates of many orders with one locking select and one UPDATE ... CASE WHEN,
+        then loads updated orders by one select.
+        Several updates of one order are coalesced (the last status wins, fields are merged).
+        Returns updated orders (with position, round, bot and oco_order loaded) in order of updates,
+        algorithm callbacks of them must be dispatched by dispatch_order_callbacks()
+        """
+        coalesced: dict[int, OrderStatusUpdate] = {}
+        for update in updates:
+            previous = coalesced.pop(update.order_id, None)
+            if previous is not None:
+                update = OrderStatusUpdate(
+                    order_id=update.order_id,
+                    status=update.status,
+                    updated_at=update.updated_at,
+                    fields=previous.fields | update.fields
+                )
+            coalesced[update.order_id] = update
+        if not coalesced:
+            return []
+
+        with transaction.atomic():
+            # Rows are locked until commit, so of concurrent writers of the same update (user data stream and
+            # history sync) only the first one applies it, the others see the new status and skip it
+            current = {
+                order_id: (status, updated_at)
+                for order_id, status, updated_at in Order.objects.select_for_update().filter(
+                    id__in=list(coalesced.keys())
+                ).values_list('id', 'status', 'updated_at')
             }
-            for key in fields:
-                update[key] = order._meta.get_field(key).value_from_object(order)
-            saved = Order.objects.filter(id=order.id, updated_at__lt=updated_at).update(**update) > 0
 
-        ignore_callback = (status == Order.Statuses.EXPIRED) and order.oco_order_id is not None
+            applied = []
+            for update in coalesced.values():
+                if update.order_id not in current:
+                    continue
+                status, updated_at = current[update.order_id]
+                if update.updated_at is not None and updated_at >= update.updated_at:
+                    continue
+                if status in cls.ORDER_FINAL_STATUSES and update.status in (Order.Statuses.ACTIVE, status):
+                    # Late or replayed event of the order, which is already done
+                    continue
+                applied.append(update)
+            if not applied:
+                return []
+
+            values = {}
+            for name in ['status'] + sorted({name for update in applied for name in update.fields}):
+                model_field = Order._meta.get_field(name)
+                whens = [
+                    When(
+                        id=update.order_id,
+                        then=Value(
+                            update.status if name == 'status' else update.fields[name],
+                            output_field=model_field
+                        )
+                    )
+                    for update in applied
+                    if name == 'status' or name in update.fields
+                ]
+                values[name] = Case(*whens, default=F(name), output_field=model_field)
+            updated_at = datetime.now(tz=timezone.utc)
+            Order.objects.filter(id__in=[update.order_id for update in applied]).update(
+                updated_at=updated_at,
+                **values
+            )
 
-        if saved and not ignore_callback:
+        orders = {
+            order.id: order
+            for order in Order.objects.select_related('position__round__bot', 'oco_order').filter(
+                id__in=[update.order_id for update in applied]
+            )
+        }
+        for order in orders.values():
+            if order.oco_order_id in orders:
+                order.oco_order = orders[order.oco_order_id]
+
+        refresh_connections_active({
+            orders[update.order_id].exchange_connection_id
+            for update in applied
+            if update.status not in (Order.Statuses.NEW, Order.Statuses.ACTIVE)
+        })
+
+        return [orders[update.order_id] for update in applied]
+
+    @classmethod
+    def dispatch_order_callbacks(cls, orders: list[Order]):
+        """
+        Executes algorithm callbacks of updated orders or, if settings.ORDER_CALLBACKS_QUEUE is set,
+        publishes jobs of them to queues of order_callbacks.py
+        """
+        from tbot.services import execute_order_callback, order_callback_queue
+        jobs = {}
+        for order in orders:
+            ignore_callback = (order.status == Order.Statuses.EXPIRED) and order.oco_order_id is not None
+            if ignore_callback or order.status == Order.Statuses.ACTIVE:
+                continue
             bot = order.position.round.bot
-            if bot.status == bot.Statuses.ON and status != order.Statuses.ACTIVE:
-                from tbot.services import execute_order_callback
+            if bot.status != bot.Statuses.ON:
+                continue
+            if settings.ORDER_CALLBACKS_QUEUE:
+                jobs.setdefault(order_callback_queue(bot_id=bot.id), []).append(
+                    OrderCallbackJob(order_id=order.id, bot_id=bot.id)
+                )
+            else:
                 execute_order_callback(order=order)
 
+        for queue, bodies in jobs.items():
+            rabbitmq.send_batch(
+                queue=queue,
+                routing_key=queue,
+                bodies=bodies,
+                queue_arguments=settings.RABBITMQ_ORDER_CALLBACK_QUEUE_ARGUMENTS
+            )
+
+    @classmethod
+    def _callback_order(cls, status: Order.Statuses, order_id: int, updated_at: datetime | None = None, **kwargs):
+        orders = cls.callback_orders(
+            updates=[OrderStatusUpdate(order_id=order_id, status=status, updated_at=updated_at, fields=kwargs)]
+        )
+        cls.dispatch_order_callbacks(orders=orders)
+
     @classmethod
     def callback_order_filled(
             cls,
@@ -1,4 +1,5 @@
 from .exchanges import Exchange
+from .prices import PriceCache
 from tbot.models import ExchangesNames, ExchangeConnection
 
 
@@ -32,6 +33,10 @@ class Fake(Exchange):
         return 1000000
 
     def get_asset_price(self, symbol: str):
+        # Prices of symbols of fake bots are published with Binance prices, even if the user has only testnet
+        price = PriceCache.get(exchange=self.exchange, symbol=symbol)
+        if price is not None:
+            return price
         return self._get_binance().get_asset_price(symbol=symbol)
 
     def _cancel_order(self, symbol: str, client_id: str):
@@ -44,6 +49,9 @@ class Fake(Exchange):
     def user_data_stream_execution(self):
         pass
 
+    def user_data_stream_attach(self, loop, on_stop=None):
+        return None
+
     @staticmethod
     def _mark_active(client_id: str):
         order_id = Exchange.order_parse_id(client_id)
@@ -72,8 +80,8 @@ class Fake(Exchange):
         self._mark_active(client_id=stop_limit_client_id)
 
     # Disable user-data-stream
-    def user_data_stream_command(self, command: str):
-        pass
+    def user_data_stream_command_body(self, command: str):
+        return None
 
     def _new_order_stop_down_limit_sell(
             self,
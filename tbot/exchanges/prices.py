@@ -0,0 +1,128 @@
+import asyncio
+import sys
+import time
+import traceback
+from asgiref.sync import sync_to_async
+from binance import AsyncClient as BinanceAsyncClient, BinanceSocketManager
+from django.conf import settings
+from django.core.cache import cache
+# noinspection PyProtectedMember
+from lib.cache import _LocalCache, _MISSING
+from tbot.models import ExchangesNames
+
+# Exchange, which stream publishes prices of symbols of exchange. Fake exchange trades by Binance prices
+PRICE_SOURCES = {
+    ExchangesNames.BINANCE: ExchangesNames.BINANCE,
+    ExchangesNames.FAKE: ExchangesNames.BINANCE,
+    ExchangesNames.BINANCETEST: ExchangesNames.BINANCETEST,
+}
+
+
+class PriceCache:
+    """
+    Latest prices of symbols, published by price_streams.py to cache, so they are shared by all processes.
+    Read prices are kept in process for LOCAL_TTL seconds, so frequent reads don't go to cache server.
+
+    Prices are average prices of the last 5 minutes, the same as GET /api/v3/avgPrice returns.
+    Every price is stored as (price, published_at) tuple, published_at is unix time.
+    """
+    LOCAL_TTL = 1
+    _local = _LocalCache(size=1024)
+
+    @staticmethod
+    def key(exchange: str, symbol: str) -> str:
+        return 'price_' + PRICE_SOURCES.get(exchange, exchange) + '_' + symbol
+
+    @classmethod
+    def set_many(cls, exchange: str, prices: dict[str, float]):
+        published_at = time.time()
+        cache.set_many(
+            {cls.key(exchange=exchange, symbol=symbol): (price, published_at) for symbol, price in prices.items()},
+            settings.PRICE_CACHE_MAX_AGE
+        )
+
+    @classmethod
+    def get(cls, exchange: str, symbol: str, max_age: float | None = None) -> float | None:
+        """
+        Returns price or None, if it is unknown or older than max_age (settings.PRICE_CACHE_MAX_AGE by default)
+        """
+        if max_age is None:
+            max_age = settings.PRICE_CACHE_MAX_AGE
+        key = cls.key(exchange=exchange, symbol=symbol)
+        item = cls._local.get(key)
+        if item is _MISSING:
+            item = cache.get(key)
+            if item is not None:
+                cls._local.set(key, item, cls.LOCAL_TTL)
+        if item is None or time.time() - item[1] > max_age:
+            return None
+        return item[0]
+
+
+class PriceStream:
+    """
+    Publishes prices of symbols, returned by symbols_func, from avgPrice streams of exchange to PriceCache.
+    Received prices are published by one cache request every PUBLISH_INTERVAL seconds.
+    Symbols are reloaded periodically, and socket is reopened if they are changed.
+    """
+    SYMBOLS_RELOAD_INTERVAL = 60
+    PUBLISH_INTERVAL = 1
+
+    def __init__(self, exchange: str, testnet: bool, symbols_func, verbose: bool = False):
+        self.exchange = exchange
+        self.testnet = testnet
+        self.symbols_func = symbols_func
+        self.verbose = verbose
+        self._received = {}
+
+    async def run(self):
+        client = await BinanceAsyncClient.create(testnet=self.testnet)
+        publisher = asyncio.get_running_loop().create_task(self._publish())
+        symbols = []
+        listener = None
+        try:
+            while True:
+                _symbols = sorted(await sync_to_async(self.symbols_func, thread_sensitive=True)())
+                if _symbols != symbols or listener is None or listener.done():
+                    if listener is not None:
+                        listener.cancel()
+                    symbols = _symbols
+                    listener = asyncio.get_running_loop().create_task(
+                        self._listen(client=client, symbols=symbols)
+                    ) if symbols else None
+                await asyncio.sleep(self.SYMBOLS_RELOAD_INTERVAL)
+        finally:
+            publisher.cancel()
+            if listener is not None:
+                listener.cancel()
+            await client.close_connection()
+
+    async def _publish(self):
+        while True:
+            await asyncio.sleep(self.PUBLISH_INTERVAL)
+            if not self._received:
+                continue
+            prices, self._received = self._received, {}
+            try:
+                await sync_to_async(PriceCache.set_many, thread_sensitive=False)(exchange=self.exchange, prices=prices)
+            except BaseException as e:
+                print(e, file=sys.stderr)
+
+    async def _listen(self, client: BinanceAsyncClient, symbols: list[str]):
+        try:
+            bm = BinanceSocketManager(client)
+            async with bm.multiplex_socket([symbol.lower() + '@avgPrice' for symbol in symbols]) as socket:
+                if self.verbose:
+                    print("Price socket of " + self.exchange + ": " + ', '.join(symbols))
+                while True:
+                    res = await socket.recv()
+                    data = res.get('data') if type(res) == dict else None
+                    if not data or 's' not in data or 'w' not in data:
+                        continue
+                    self._received[data['s']] = float(data['w'])
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            # Socket will be reopened by run() on the next symbols reload
+            print(e, file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from django.core.cache import cache
+
+
+class _Bucket:
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated_at')
+
+    def __init__(self, capacity: float, interval: float):
+        self.capacity = capacity
+        self.rate = capacity / interval
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, floor: float = 0) -> float:
+        lack = amount + floor - self.tokens
+        return 0 if lack <= 0 else lack / self.rate
+
+    def set_used(self, used: float):
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RateLimiter:
+    """
+    Token buckets of request weight and order count of one exchange connection.
+
+    Requests wait for tokens instead of being rejected by exchange. Waiting requests are served by priority,
+    and the last part of weight bucket is reserved for orders, so history sync can't delay order placement.
+    Buckets are corrected by real usage, reported by exchange in response headers.
+    """
+    PRIORITY_ORDER = 0
+    PRIORITY_DEFAULT = 1
+    PRIORITY_SYNC = 2
+
+    # Max sleep between attempts, lets waiters notice changes of priorities and blocks
+    POLL_INTERVAL = 0.5
+
+    # Counters are published to cache not often than this interval (seconds)
+    PUBLISH_INTERVAL = 10
+
+    def __init__(
+            self,
+            name: str,
+            weight_limit: int,
+            weight_interval: float,
+            order_limit: int,
+            order_interval: float,
+            order_reserve: float = 0.2,
+    ):
+        self.name = name
+        self._lock = threading.Lock()
+        self._weight = _Bucket(capacity=weight_limit, interval=weight_interval)
+        self._orders = _Bucket(capacity=order_limit, interval=order_interval)
+        self._order_reserve = weight_limit * order_reserve
+        self._waiting = [0, 0, 0]
+        self._blocked_until = 0
+        self._published_at = 0
+        self.counters = {
+            'requests': 0,
+            'delayed': 0,
+            'delay_seconds': 0.0,
+            'rejected': 0,
+            'banned': 0,
+            'used_weight': 0,
+            'order_count': 0,
+        }
+
+    @staticmethod
+    def cache_key(name: str) -> str:
+        return 'rate_limiter_' + name
+
+    def _try_acquire(self, weight: int, orders: int, priority: int) -> float:
+        """
+        Takes tokens, if they are available. Returns 0 on success, otherwise seconds to wait
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if any(self._waiting[:priority]):
+                return self.POLL_INTERVAL
+            self._weight.refill(now)
+            self._orders.refill(now)
+            floor = 0 if priority == self.PRIORITY_ORDER else self._order_reserve
+            wait = max(self._weight.wait_time(weight, floor), self._orders.wait_time(orders))
+            if wait > 0:
+                return wait
+            self._weight.tokens -= weight
+            self._orders.tokens -= orders
+            self.counters['requests'] += 1
+            return 0
+
+    def _waiting_changed(self, priority: int, delta: int, delay: float = 0):
+        with self._lock:
+            self._waiting[priority] += delta
+            if delta < 0:
+                self.counters['delayed'] += 1
+                self.counters['delay_seconds'] += delay
+
+    def acquire(self, weight: int = 1, orders: int = 0, priority: int = PRIORITY_DEFAULT):
+        wait = self._try_acquire(weight=weight, orders=orders, priority=priority)
+        if wait == 0:
+            return
+        started_at = time.monotonic()
+        self._waiting_changed(priority=priority, delta=1)
+        try:
+            while wait > 0:
+                time.sleep(min(wait, self.POLL_INTERVAL))
+                wait = self._try_acquire(weight=weight, orders=orders, priority=priority)
+        finally:
+            self._waiting_changed(priority=priority, delta=-1, delay=time.monotonic() - started_at)
+
+    async def aacquire(self, weight: int = 1, orders: int = 0, priority: int = PRIORITY_DEFAULT):
+        wait = self._try_acquire(weight=weight, orders=orders, priority=priority)
+        if wait == 0:
+            return
+        started_at = time.monotonic()
+        self._waiting_changed(priority=priority, delta=1)
+        try:
+            while wait > 0:
+                await asyncio.sleep(min(wait, self.POLL_INTERVAL))
+                wait = self._try_acquire(weight=weight, orders=orders, priority=priority)
+        finally:
+            self._waiting_changed(priority=priority, delta=-1, delay=time.monotonic() - started_at)
+
+    def update(self, headers):
+        """
+        Corrects buckets by usage, reported by Binance in X-MBX-USED-WEIGHT-* and X-MBX-ORDER-COUNT-* headers
+        """
+        if headers is None:
+            return
+        used_weight = headers.get('X-MBX-USED-WEIGHT-1M')
+        order_count = headers.get('X-MBX-ORDER-COUNT-10S')
+        with self._lock:
+            if used_weight is not None:
+                self.counters['used_weight'] = int(used_weight)
+                self._weight.set_used(int(used_weight))
+            if order_count is not None:
+                self.counters['order_count'] = int(order_count)
+                self._orders.set_used(int(order_count))
+        self.publish()
+
+    def rejected(self, status_code: int, headers) -> bool:
+        """
+        Blocks requests after 429 (too many requests) and 418 (IP ban) responses.
+        Returns True, if the request may be retried after block
+        """
+        if status_code not in (418, 429):
+            return False
+        retry_after = headers.get('Retry-After') if headers is not None else None
+        retry_after = float(retry_after) if retry_after is not None else 60
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            self.counters['rejected' if status_code == 429 else 'banned'] += 1
+        self.publish(force=True)
+        return status_code == 429
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._weight.refill(now)
+            self._orders.refill(now)
+            return self.counters | {
+                'weight_tokens': self._weight.tokens,
+                'order_tokens': self._orders.tokens,
+                'waiting': sum(self._waiting),
+                'blocked_for': max(0.0, self._blocked_until - now),
+            }
+
+    def publish(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._published_at < self.PUBLISH_INTERVAL:
+            return
+        self._published_at = now
+        cache.set(self.cache_key(self.name), self.stats(), self.PUBLISH_INTERVAL * 6)
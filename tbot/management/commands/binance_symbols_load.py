@@ -1,23 +1,11 @@
+import time
 from django.core.management.base import BaseCommand
-from binance.client import Client
+from django.db import transaction
+from django.core.cache import cache
+from db.fields import to_decimal
 from tbot.models import Symbol, ExchangesNames
-from lib import cached
-
-
-@cached('binance_exchange_info', 15*60)
-def get_binance_exchange_info():
-    client = Client()
-    return client.get_exchange_info()
-
-
-def get_filter(symbol_info, filter_name, filter_param):
-    if 'filters' in symbol_info:
-        for _filter in symbol_info['filters']:
-            if _filter['filterType'] == filter_name:
-                if filter_param in _filter:
-                    return _filter[filter_param]
-
-    return None
+from tbot.symbols import SymbolRegistry
+from tbot.exchanges.exchange_info import get_binance_exchange_info, get_filter
 
 
 # https://habr.com/ru/post/415049/
@@ -28,42 +16,108 @@ class Command(BaseCommand):
     def get_exchange_name(cls):
         return ExchangesNames.BINANCE
 
-    def handle(self, *args, **options):
+    # Rows in one INSERT/UPDATE query
+    BATCH_SIZE = 500
+
+    FIELDS = [
+        'symbol',
+        'min_notional',
+        'min_price',
+        'max_price',
+        'tick_size',
+        'step_size',
+        'min_qty',
+        'enabled',
+    ]
+
+    @staticmethod
+    def get_symbol_fields(symbol_info) -> dict:
+        enabled = True
+        if symbol_info['status'] != 'TRADING':
+            enabled = False
+        if not symbol_info['ocoAllowed']:
+            enabled = False
+        if not symbol_info['isSpotTradingAllowed']:
+            enabled = False
+
+        return {
+            'symbol': symbol_info['symbol'],
+            'min_notional': to_decimal(get_filter(symbol_info, 'MIN_NOTIONAL', 'minNotional')),
+            'min_price': to_decimal(get_filter(symbol_info, 'PRICE_FILTER', 'minPrice')),
+            'max_price': to_decimal(get_filter(symbol_info, 'PRICE_FILTER', 'maxPrice')),
+            'tick_size': to_decimal(get_filter(symbol_info, 'PRICE_FILTER', 'tickSize')),
+            'step_size': to_decimal(get_filter(symbol_info, 'LOT_SIZE', 'stepSize')),
+            'min_qty': to_decimal(get_filter(symbol_info, 'LOT_SIZE', 'minQty')),
+            # 'multiplier_up': float(get_filter(symbol_info, 'PERCENT_PRICE', 'multiplierUp')),
+            # 'multiplier_down': float(get_filter(symbol_info, 'PERCENT_PRICE', 'multiplierDown')),
+            # 'multiplier_avg_price_minutes': float(get_filter(symbol_info, 'PERCENT_PRICE', 'avgPriceMins')),
+            'enabled': enabled,
+        }
 
-        client = Client()
-        info = client.get_exchange_info()
+    def handle(self, *args, **options):
+        time_start = time.perf_counter()
+        if options['force']:
+            get_binance_exchange_info.invalidate()
+        info = get_binance_exchange_info()
+        time_fetched = time.perf_counter()
+
+        fingerprint_key = 'symbols_fingerprint_' + self.get_exchange_name()
+        if not options['force'] and cache.get(fingerprint_key) == info['fingerprint']:
+            print('Symbols are not changed since the last load (serverTime ' + str(info['server_time']) + ')')
+            return
+
+        existing = {
+            (symbol.base_asset, symbol.quote_asset): symbol
+            for symbol in Symbol.objects.filter(exchange=self.get_exchange_name())
+        }
+        to_create = []
+        to_update = []
+        unchanged = 0
         for symbol_info in info['symbols']:
-
-            symbol, created = Symbol.objects.get_or_create(
-                exchange=self.get_exchange_name(),
-                base_asset=symbol_info['baseAsset'],
-                quote_asset=symbol_info['quoteAsset']
-            )
-
-            symbol.symbol = symbol_info['symbol']
-            symbol.min_notional = float(get_filter(symbol_info, 'MIN_NOTIONAL', 'minNotional'))
-
-            symbol.min_price = float(get_filter(symbol_info, 'PRICE_FILTER', 'minPrice'))
-            symbol.max_price = float(get_filter(symbol_info, 'PRICE_FILTER', 'maxPrice'))
-            symbol.tick_size = float(get_filter(symbol_info, 'PRICE_FILTER', 'tickSize'))
-
-            symbol.step_size = float(get_filter(symbol_info, 'LOT_SIZE', 'stepSize'))
-            symbol.min_qty = float(get_filter(symbol_info, 'LOT_SIZE', 'minQty'))
-
-            # symbol.multiplier_up = float(get_filter(symbol_info, 'PERCENT_PRICE', 'multiplierUp'))
-            # symbol.multiplier_down = float(get_filter(symbol_info, 'PERCENT_PRICE', 'multiplierDown'))
-            # symbol.multiplier_avg_price_minutes = float(get_filter(symbol_info, 'PERCENT_PRICE', 'avgPriceMins'))
-
-            enabled = True
-            if symbol_info['status'] != 'TRADING':
-                enabled = False
-            if not symbol_info['ocoAllowed']:
-                enabled = False
-            if not symbol_info['isSpotTradingAllowed']:
-                enabled = False
-
-            symbol.enabled = enabled
-
-            symbol.save()
-
-            print(symbol.symbol + ': ' + ('Created' if created else 'Saved'))
+            fields = self.get_symbol_fields(symbol_info)
+            symbol = existing.get((symbol_info['baseAsset'], symbol_info['quoteAsset']))
+            if symbol is None:
+                to_create.append(Symbol(
+                    exchange=self.get_exchange_name(),
+                    base_asset=symbol_info['baseAsset'],
+                    quote_asset=symbol_info['quoteAsset'],
+                    **fields
+                ))
+                print(fields['symbol'] + ': Created')
+            elif any(getattr(symbol, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(symbol, name, value)
+                to_update.append(symbol)
+                print(fields['symbol'] + ': Saved')
+            else:
+                unchanged += 1
+        time_compared = time.perf_counter()
+
+        with transaction.atomic():
+            Symbol.objects.bulk_create(to_create, batch_size=self.BATCH_SIZE)
+            Symbol.objects.bulk_update(to_update, self.FIELDS, batch_size=self.BATCH_SIZE)
+        time_saved = time.perf_counter()
+
+        print('Created: %d, updated: %d, unchanged: %d' % (len(to_create), len(to_update), unchanged))
+        print('Fetch: %.2fs, compare: %.2fs, save: %.2fs, total: %.2fs' % (
+            time_fetched - time_start,
+            time_compared - time_fetched,
+            time_saved - time_compared,
+            time_saved - time_start
+        ))
+
+        if to_create or to_update:
+            # Running processes will reload symbols
+            SymbolRegistry.bump_version(exchange=self.get_exchange_name())
+        cache.set(fingerprint_key, info['fingerprint'], None)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-f',
+            '--force',
+            action='store_true',
+            default=False,
+            help='Download exchange info and compare all symbols, even if they are not changed',
+            required=False,
+            dest='force'
+        )
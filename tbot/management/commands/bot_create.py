@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from lib import boolean_input, is_percent, percent_to_float
 from tbot.models import Symbol, User, ExchangesNames, ExchangeConnection, Bot, SettingType
+from tbot.symbols import SymbolRegistry
 from tbot.exchanges import Exchange
 from tbot.algorithms import Algorithm
 
@@ -29,7 +30,7 @@ class Command(BaseCommand):
 
         symbol_name = str(options['symbol']).upper()
         try:
-            symbol = Symbol.objects.get(symbol=symbol_name, exchange=exchange_name)
+            symbol = SymbolRegistry.get(exchange=exchange_name, symbol=symbol_name)
         except Symbol.DoesNotExist:
             print("Symbol " + symbol_name + " not in DB")
             return
@@ -130,7 +131,7 @@ class Command(BaseCommand):
         bot = Bot(
             owner=user,
             exchange_connection=exchange_connection,
-            symbol=symbol,
+            symbol_id=symbol.id,
             price_limit_type=price_limit_type,
             price_limit=price_limit,
             lot=lot,
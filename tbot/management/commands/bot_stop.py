@@ -4,7 +4,7 @@ from argparse import RawTextHelpFormatter
 from tbot.models import Bot, Order, Round, Position
 from tbot.exchanges import Exchange
 from lib import boolean_input, print_object
-from django.db.models import Sum, F
+from django.db.models import Sum
 
 
 class Command(BaseCommand):
@@ -36,7 +36,7 @@ class Command(BaseCommand):
             print("Bot is not enabled")
             return
 
-        active_orders = Order.objects.filter(position__round__bot_id=bot.id, status=Order.Statuses.ACTIVE)
+        active_orders = Order.objects.filter(bot_id=bot.id, status=Order.Statuses.ACTIVE)
         sell_qty = 0
         last_round = Round.objects.filter(bot=bot).order_by('-id')[:1][0]
 
@@ -75,11 +75,15 @@ class Command(BaseCommand):
                 print("Following order will be canceled:")
                 print_orders(orders=active_orders)
                 print("And bought base asset will be sold:")
-                sell_orders = Order.objects.filter(position__round_id=last_round, status=Order.Statuses.FILLED)
+                sell_orders = Order.objects.filter(
+                    bot_id=bot.id,
+                    status=Order.Statuses.FILLED,
+                    position__round_id=last_round
+                )
                 print_orders(orders=sell_orders, key_filter=['result_quote_asset_quantity', 'result_filled_quantity'])
-                d = round(1 / bot.symbol.min_qty)
+                # Sum of fixed point values is exact
                 sell_qty = Order.objects.filter(position__round=last_round)\
-                    .aggregate(sum=Sum(F('result_filled_quantity')*d))['sum'] / d
+                    .aggregate(sum=Sum('result_filled_quantity'))['sum']
                 print("\nTotal will be sold: " + str(sell_qty))
 
         if not boolean_input(question="Are you sure? [yN]", default=False):
@@ -92,9 +96,8 @@ class Command(BaseCommand):
         exchange = Exchange.get_exchange(exchange=bot.exchange_connection.exchange)(connection=bot.exchange_connection)
 
         if type_key == 'keep' or type_key == 'revert':
-            for order in active_orders:
-                exchange.cancel_order(order=order)
-                print('.', end='')
+            canceled = exchange.cancel_orders(orders=list(active_orders))
+            print('.' * len(canceled), end='')
 
         if sell_qty != 0:
             position = Position.objects.filter(round=last_round).order_by('-id')[:1][0]
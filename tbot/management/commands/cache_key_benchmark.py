@@ -0,0 +1,61 @@
+import hashlib
+import json
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+# noinspection PyProtectedMember
+from lib.cache import _make_key
+from tbot.models import Symbol
+
+
+def _make_key_json(args, kwargs, typed):
+    # Previous implementation of lib.cache._make_key
+    key = args
+    if kwargs:
+        for item in kwargs.items():
+            key += item
+    if typed:
+        key += tuple(type(v) for v in args)
+        if kwargs:
+            key += tuple(type(v) for v in kwargs.values())
+    elif len(key) == 1 and type(key[0]) in {int, str}:
+        return key[0]
+    return hashlib.md5(json.dumps(key).encode()).hexdigest()
+
+
+class Command(BaseCommand):
+    help = 'Compares speed of cache key construction with previous (json + md5) implementation'
+
+    def handle(self, *args, **options):
+        number = int(options['number'])
+        cases = {
+            'one int': ((123456,), {}),
+            'one str': (('BTCUSDT',), {}),
+            'str and int': (('BINANCE', 'BTCUSDT'), {'limit': 500}),
+            'long list': ((list(range(100)),), {}),
+            'decimal': ((Decimal('0.00010000'),), {}),
+            'model': ((Symbol(id=1, symbol='BTCUSDT'),), {}),
+        }
+
+        for name, (_args, _kwargs) in cases.items():
+            results = []
+            for func in [_make_key_json, _make_key]:
+                try:
+                    time_start = time.perf_counter()
+                    for _ in range(number):
+                        func(_args, _kwargs, False)
+                    results.append('%.0f keys/s' % (number / (time.perf_counter() - time_start)))
+                except TypeError:
+                    results.append('not supported')
+            print('%s: json+md5 %s, new %s' % (name, results[0], results[1]))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n',
+            '--number',
+            action='store',
+            default=100000,
+            help='Number of keys of every case',
+            required=False,
+            dest='number'
+        )
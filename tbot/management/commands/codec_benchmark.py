@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from lib import codec
+from tbot.dto import ExchangeConnectionWorkerCommand, ExchangeConnectionWorkerCommands
+
+
+class Command(BaseCommand):
+    help = 'Compares encode/decode throughput and message size of codecs of RabbitMQ messages'
+
+    def handle(self, *args, **options):
+        number = int(options['number'])
+        body = ExchangeConnectionWorkerCommand(
+            exchange_connection_id=123456,
+            command=ExchangeConnectionWorkerCommands.START
+        )
+
+        for name in [codec.PICKLE, codec.STRUCT]:
+            time_start = time.perf_counter()
+            for _ in range(number):
+                data = codec.encode(body, codec=name)
+            encode_time = time.perf_counter() - time_start
+
+            time_start = time.perf_counter()
+            for _ in range(number):
+                codec.decode(data)
+            decode_time = time.perf_counter() - time_start
+
+            assert codec.decode(data) == body
+            print('%s: %d bytes, encode %.0f msg/s, decode %.0f msg/s' % (
+                name,
+                len(data),
+                number / encode_time,
+                number / decode_time
+            ))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n',
+            '--number',
+            action='store',
+            default=100000,
+            help='Number of messages',
+            required=False,
+            dest='number'
+        )
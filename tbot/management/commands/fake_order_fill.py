@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from tbot.models import Order, ExchangesNames
 from tbot.exchanges import Fake
 from lib import boolean_input
+from db.fields import to_decimal
 
 
 class Command(BaseCommand):
@@ -10,7 +11,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         def get_option(name):
             if name in options and options[name] is not None:
-                return float(options[name])
+                return to_decimal(options[name])
             return None
 
         order = Order.objects.get(id=int(options['order_id']))
@@ -35,7 +36,7 @@ class Command(BaseCommand):
                     print('Price is ' + str(price) + ', calculated from input')
                 else:
                     exchange = Fake(connection=order.position.round.bot.exchange_connection)
-                    price = exchange.get_asset_price(order.position.round.bot.symbol.symbol)
+                    price = to_decimal(exchange.get_asset_price(order.position.round.bot.symbol.symbol))
                     print('Price is ' + str(price) + ', gotten from Binance')
 
         quote_quantity = order.quote_quantity
@@ -0,0 +1,130 @@
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Subquery, Q, Min
+from django.utils import timezone
+from tbot.models import Bot, Round, Order, OrderArchive
+
+
+def _next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+class Command(BaseCommand):
+    help = 'Moves orders of finished rounds to partitioned (by month) archive table'
+
+    def handle(self, *args, **options):
+        batch_size = int(options['batch_size'])
+        cutoff = timezone.now() - timedelta(days=int(options['days']))
+        time_start = time.perf_counter()
+
+        round_ids = list(self.finished_rounds(cutoff=cutoff).values_list('id', flat=True))
+        if not round_ids:
+            print("Nothing to archive")
+            return
+
+        self.ensure_partitions(
+            first=Order.objects.filter(position__round_id__in=round_ids).aggregate(min=Min('created_at'))['min'],
+            last=cutoff
+        )
+
+        total = 0
+        for start in range(0, len(round_ids), batch_size):
+            total += self.archive_rounds(round_ids=round_ids[start:start + batch_size])
+            print("Archived orders: " + str(total) + ", rounds: " + str(min(start + batch_size, len(round_ids))))
+
+        print("Done in %.2fs" % (time.perf_counter() - time_start))
+
+    @staticmethod
+    def finished_rounds(cutoff):
+        """
+        Rounds without orders on exchange, which are not current rounds of working bots and were not changed
+        after cutoff
+        """
+        orders = Order.objects.filter(position__round_id=OuterRef('id'))
+        latest_rounds = Round.objects.filter(bot_id=OuterRef('bot_id')).order_by('-id').values('id')[:1]
+        return Round.objects.filter(
+            Q(~Q(bot__status=Bot.Statuses.ON) | ~Q(id=Subquery(latest_rounds))),
+            Exists(orders),
+            ~Exists(orders.filter(status__in=[Order.Statuses.NEW, Order.Statuses.ACTIVE])),
+            ~Exists(orders.filter(updated_at__gte=cutoff)),
+        ).order_by('id')
+
+    @staticmethod
+    def ensure_partitions(first, last):
+        """
+        Adds monthly partitions up to the month of last, splitting p_future partition. Rows older than the first
+        partition are stored in it.
+        """
+        table = OrderArchive._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT PARTITION_NAME FROM information_schema.PARTITIONS"
+                " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME != 'p_future'",
+                [table]
+            )
+            existing = sorted(row[0] for row in cursor.fetchall())
+            if existing:
+                month = _next_month(date(int(existing[-1][1:5]), int(existing[-1][5:7]), 1))
+            else:
+                month = first.date().replace(day=1)
+
+            partitions = []
+            while month <= last.date():
+                partitions.append("PARTITION p%s VALUES LESS THAN (TO_DAYS('%s'))" % (
+                    month.strftime('%Y%m'),
+                    _next_month(month).isoformat()
+                ))
+                month = _next_month(month)
+            if not partitions:
+                return
+
+            # p_future is empty, because rows are archived only up to the month of last, so it is split at once
+            cursor.execute("ALTER TABLE `%s` REORGANIZE PARTITION p_future INTO (%s)" % (
+                table,
+                ", ".join(partitions + ["PARTITION p_future VALUES LESS THAN MAXVALUE"])
+            ))
+            print("Added partitions: " + str(len(partitions)))
+
+    @staticmethod
+    def archive_rounds(round_ids: list[int]) -> int:
+        columns = ", ".join("`%s`" % column for column in OrderArchive.ORDER_FIELDS)
+        position_ids = "SELECT id FROM `tbot_position` WHERE round_id IN (%s)" % ", ".join(["%s"] * len(round_ids))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO `%s` (%s, `archived_at`) SELECT %s, %%s FROM `%s` WHERE position_id IN (%s)" % (
+                    OrderArchive._meta.db_table,
+                    columns,
+                    columns,
+                    Order._meta.db_table,
+                    position_ids
+                ),
+                [timezone.now()] + round_ids
+            )
+            archived = cursor.rowcount
+            # OCO siblings reference each other, links are removed before DELETE to pass foreign key checks
+            Order.objects.filter(position__round_id__in=round_ids, oco_order__isnull=False).update(oco_order=None)
+            deleted = Order.objects.filter(position__round_id__in=round_ids).delete()[0]
+            assert deleted == archived, "Archived %d orders, but deleted %d" % (archived, deleted)
+        return archived
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-d',
+            '--days',
+            action='store',
+            default=30,
+            help='Orders of rounds, which were changed during the days, are not archived',
+            required=False,
+            dest='days'
+        )
+        parser.add_argument(
+            '-b',
+            '--batch_size',
+            action='store',
+            default=100,
+            help='Number of rounds, archived in one transaction',
+            required=False,
+            dest='batch_size'
+        )
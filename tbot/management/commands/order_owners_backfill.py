@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery, Min, Max
+from tbot.models import Order, Position
+
+
+class Command(BaseCommand):
+    help = 'Fills denormalized bot and exchange_connection of orders, missed by migration 0028 (created by old code)'
+
+    def handle(self, *args, **options):
+        batch_size = int(options['batch_size'])
+        bounds = Order.objects.filter(bot__isnull=True).aggregate(min=Min('id'), max=Max('id'))
+        if bounds['min'] is None:
+            print("Nothing to fill")
+            return
+
+        positions = Position.objects.filter(id=OuterRef('position_id'))
+        total = 0
+        time_start = time.perf_counter()
+        for start in range(bounds['min'], bounds['max'] + 1, batch_size):
+            # Every batch is a separate short UPDATE by primary key range
+            total += Order.objects.filter(bot__isnull=True, id__gte=start, id__lt=start + batch_size).update(
+                bot_id=Subquery(positions.values('round__bot_id')[:1]),
+                exchange_connection_id=Subquery(positions.values('round__bot__exchange_connection_id')[:1])
+            )
+            print("Filled: " + str(total) + " (id < " + str(start + batch_size) + ")")
+
+        print("Done in %.2fs" % (time.perf_counter() - time_start))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-b',
+            '--batch_size',
+            action='store',
+            default=10000,
+            help='Number of ids in one UPDATE',
+            required=False,
+            dest='batch_size'
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.core.cache import cache
+from tbot.models import ExchangeConnection
+from tbot.exchanges.rate_limiter import RateLimiter
+
+
+class Command(BaseCommand):
+    help = 'Rate limiter counters of exchange connections, published by running processes'
+
+    def handle(self, *args, **options):
+        connections = ExchangeConnection.objects.all()
+        if options['connection_id'] is not None:
+            connections = connections.filter(id=int(options['connection_id']))
+
+        keys = {RateLimiter.cache_key(str(connection.id)): connection for connection in connections}
+        stats = cache.get_many(keys.keys())
+        for key, connection in keys.items():
+            if key not in stats:
+                continue
+            print(str(connection.id) + ' (' + connection.exchange + '):')
+            for name, value in stats[key].items():
+                print('\t%s: %s' % (name, value))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-c',
+            '--connection_id',
+            action='store',
+            default=None,
+            help='Exchange connection ID. If not set - all connections will be shown',
+            required=False,
+            dest='connection_id'
+        )
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tbot', '0026_auto_20230125_1927'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSyncCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=32)),
+                ('last_order_id', models.BigIntegerField(default=0)),
+                ('last_update_time', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('exchange_connection', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, to='tbot.exchangeconnection')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ordersynccursor',
+            constraint=models.UniqueConstraint(
+                fields=('exchange_connection', 'symbol'), name='exchange_connection_and_symbol'),
+        ),
+    ]
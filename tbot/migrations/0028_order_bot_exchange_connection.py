@@ -0,0 +1,49 @@
+# Generated by Django 3.2.16 on 2026-10-18 14:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 10000
+
+
+def fill_order_owners(apps, schema_editor):
+    # The same as order_owners_backfill command: short UPDATEs by primary key ranges
+    Order = apps.get_model('tbot', 'Order')
+    Position = apps.get_model('tbot', 'Position')
+    bounds = Order.objects.filter(bot__isnull=True).aggregate(min=models.Min('id'), max=models.Max('id'))
+    if bounds['min'] is None:
+        return
+    positions = Position.objects.filter(id=models.OuterRef('position_id'))
+    for start in range(bounds['min'], bounds['max'] + 1, BATCH_SIZE):
+        Order.objects.filter(bot__isnull=True, id__gte=start, id__lt=start + BATCH_SIZE).update(
+            bot_id=models.Subquery(positions.values('round__bot_id')[:1]),
+            exchange_connection_id=models.Subquery(positions.values('round__bot__exchange_connection_id')[:1])
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tbot', '0027_ordersynccursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='bot',
+            field=models.ForeignKey(
+                blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='tbot.bot'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='exchange_connection',
+            field=models.ForeignKey(
+                blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE,
+                to='tbot.exchangeconnection'),
+        ),
+        migrations.AlterIndexTogether(
+            name='order',
+            index_together={('position', 'position_key'), ('bot', 'status'), ('exchange_connection', 'status')},
+        ),
+        migrations.RunPython(fill_order_owners, migrations.RunPython.noop),
+    ]
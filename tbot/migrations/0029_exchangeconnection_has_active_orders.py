@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+def fill_has_active_orders(apps, schema_editor):
+    ExchangeConnection = apps.get_model('tbot', 'ExchangeConnection')
+    Order = apps.get_model('tbot', 'Order')
+    ExchangeConnection.objects.update(has_active_orders=models.Exists(Order.objects.filter(
+        position__round__bot__exchange_connection_id=models.OuterRef('id'),
+        status__in=['NEW', 'ACTIVE']
+    )))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tbot', '0028_order_bot_exchange_connection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchangeconnection',
+            name='has_active_orders',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(fill_has_active_orders, migrations.RunPython.noop),
+    ]
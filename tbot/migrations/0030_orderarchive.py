@@ -0,0 +1,85 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tbot', '0029_exchangeconnection_has_active_orders'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderArchive',
+                    fields=[
+                        ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('created_at', models.DateTimeField()),
+                        ('updated_at', models.DateTimeField()),
+                        ('archived_at', models.DateTimeField()),
+                        ('position_id', models.BigIntegerField()),
+                        ('bot_id', models.BigIntegerField(null=True)),
+                        ('exchange_connection_id', models.BigIntegerField(null=True)),
+                        ('oco_order_id', models.BigIntegerField(null=True)),
+                        ('status', models.CharField(max_length=32)),
+                        ('type', models.CharField(max_length=32, null=True)),
+                        ('side', models.CharField(max_length=32, null=True)),
+                        ('quote_quantity', models.FloatField(null=True)),
+                        ('quantity', models.FloatField(null=True)),
+                        ('price', models.FloatField(null=True)),
+                        ('stop_price', models.FloatField(null=True)),
+                        ('callback', models.TextField()),
+                        ('position_key', models.CharField(max_length=128, null=True)),
+                        ('callback_status', models.CharField(max_length=32)),
+                        ('callback_at', models.DateTimeField(null=True)),
+                        ('result_quote_asset_quantity', models.FloatField(null=True)),
+                        ('result_filled_quantity', models.FloatField(null=True)),
+                    ],
+                    options={
+                        'db_table': 'tbot_orderarchive',
+                        'managed': False,
+                    },
+                ),
+            ],
+            database_operations=[
+                # Partitions of months are added by order_archive command, before rows of the month are moved
+                migrations.RunSQL(
+                    sql="""
+                        CREATE TABLE `tbot_orderarchive` (
+                            `id` bigint NOT NULL,
+                            `created_at` datetime(6) NOT NULL,
+                            `updated_at` datetime(6) NOT NULL,
+                            `archived_at` datetime(6) NOT NULL,
+                            `position_id` bigint NOT NULL,
+                            `bot_id` bigint NULL,
+                            `exchange_connection_id` bigint NULL,
+                            `oco_order_id` bigint NULL,
+                            `status` varchar(32) NOT NULL,
+                            `type` varchar(32) NULL,
+                            `side` varchar(32) NULL,
+                            `quote_quantity` double precision NULL,
+                            `quantity` double precision NULL,
+                            `price` double precision NULL,
+                            `stop_price` double precision NULL,
+                            `callback` longtext NOT NULL,
+                            `position_key` varchar(128) NULL,
+                            `callback_status` varchar(32) NOT NULL,
+                            `callback_at` datetime(6) NULL,
+                            `result_quote_asset_quantity` double precision NULL,
+                            `result_filled_quantity` double precision NULL,
+                            PRIMARY KEY (`id`, `created_at`),
+                            KEY `tbot_orderarchive_bot_id_created_at` (`bot_id`, `created_at`),
+                            KEY `tbot_orderarchive_connection_created` (`exchange_connection_id`, `created_at`),
+                            KEY `tbot_orderarchive_position_id` (`position_id`)
+                        )
+                        PARTITION BY RANGE (TO_DAYS(`created_at`)) (
+                            PARTITION `p_future` VALUES LESS THAN MAXVALUE
+                        )
+                    """,
+                    reverse_sql="DROP TABLE `tbot_orderarchive`",
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:00
+
+import db.fields
+from django.db import migrations
+
+# Money columns of tables, converted from DOUBLE to BIGINT units of 10 ** -8
+COLUMNS = {
+    'tbot_symbol': ['min_notional', 'min_price', 'max_price', 'tick_size', 'step_size', 'min_qty', 'price'],
+    'tbot_bot': ['lot'],
+    'tbot_order': [
+        'quote_quantity',
+        'quantity',
+        'price',
+        'stop_price',
+        'result_quote_asset_quantity',
+        'result_filled_quantity',
+    ],
+    'tbot_orderarchive': [
+        'quote_quantity',
+        'quantity',
+        'price',
+        'stop_price',
+        'result_quote_asset_quantity',
+        'result_filled_quantity',
+    ],
+}
+FACTOR = 10 ** db.fields.DEFAULT_SCALE
+
+
+def convert(table: str, columns: list[str]) -> migrations.RunSQL:
+    # Every table is scaled by one UPDATE and rebuilt by one ALTER
+    return migrations.RunSQL(
+        sql=[
+            "UPDATE `%s` SET %s" % (table, ", ".join("`%s` = ROUND(`%s` * %d)" % (c, c, FACTOR) for c in columns)),
+            "ALTER TABLE `%s` %s" % (table, ", ".join("MODIFY `%s` bigint NULL" % c for c in columns)),
+        ],
+        reverse_sql=[
+            "ALTER TABLE `%s` %s" % (table, ", ".join("MODIFY `%s` double precision NULL" % c for c in columns)),
+            "UPDATE `%s` SET %s" % (table, ", ".join("`%s` = `%s` / %d" % (c, c, FACTOR) for c in columns)),
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tbot', '0030_orderarchive'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name=model_name,
+                    name=name,
+                    field=db.fields.FixedPointField(blank=True, default=None, null=True),
+                )
+                for model_name, table in [('symbol', 'tbot_symbol'), ('bot', 'tbot_bot'), ('order', 'tbot_order')]
+                for name in COLUMNS[table]
+            ] + [
+                migrations.AlterField(
+                    model_name='orderarchive',
+                    name=name,
+                    field=db.fields.FixedPointField(null=True),
+                )
+                for name in COLUMNS['tbot_orderarchive']
+            ],
+            database_operations=[convert(table=table, columns=columns) for table, columns in COLUMNS.items()],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tbot', '0031_fixed_point_money_fields'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='ordersynccursor',
+            name='last_update_time',
+        ),
+    ]
@@ -1,8 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
-from db.fields import EnumField
+from db.fields import EnumField, FixedPointField
 
 
 class ExchangesNames(models.TextChoices):
@@ -36,31 +36,31 @@ class Symbol(models.Model):
     # Minimum order size expressed in quote_asset
     # https://binance-docs.github.io/apidocs/spot/en/#filters
     # MIN_NOTIONAL
-    min_notional = models.FloatField(null=True, blank=True, default=None)
+    min_notional = FixedPointField(null=True, blank=True, default=None)
 
     # Minimum and maximum prices for order
     # https://binance-docs.github.io/apidocs/spot/en/#filters
     # PRICE_FILTER
-    min_price = models.FloatField(null=True, blank=True, default=None)
-    max_price = models.FloatField(null=True, blank=True, default=None)
+    min_price = FixedPointField(null=True, blank=True, default=None)
+    max_price = FixedPointField(null=True, blank=True, default=None)
 
     # defines the intervals that a price/stopPrice can be increased/decreased by; disabled on tickSize == 0
     # https://binance-docs.github.io/apidocs/spot/en/#filters
     # PRICE_FILTER
-    tick_size = models.FloatField(null=True, blank=True, default=None)
+    tick_size = FixedPointField(null=True, blank=True, default=None)
 
     # Defines the intervals that a quantity/icebergQty can be increased/decreased by.
     # https://binance-docs.github.io/apidocs/spot/en/#filters
     # LOT_SIZE
-    step_size = models.FloatField(null=True, blank=True, default=None)
+    step_size = FixedPointField(null=True, blank=True, default=None)
 
     # defines the minimum quantity/icebergQty allowed
     # https://binance-docs.github.io/apidocs/spot/en/#filters
     # LOT_SIZE
-    min_qty = models.FloatField(null=True, blank=True, default=None)
+    min_qty = FixedPointField(null=True, blank=True, default=None)
 
     # Current price of Base_asset, expressed in quote_asset
-    price = models.FloatField(null=True, blank=True, default=None)
+    price = FixedPointField(null=True, blank=True, default=None)
 
     # True if symbol matches the following parameters:
     # - Symbol_status = TRADING. Can also take values LISTED/DELISTED/HOLD/etc.
@@ -115,6 +115,9 @@ class ExchangeConnection(models.Model):
     API_secret = models.TextField()
     commission = models.FloatField(default=0.001)
 
+    # True, if connection has NEW or ACTIVE orders (look mark_connections_active, refresh_connections_active)
+    has_active_orders = models.BooleanField(default=False, db_index=True)
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['owner', 'exchange'], name='owner_and_exchange')
@@ -139,7 +142,7 @@ class Bot(models.Model):
     # can be set, can be expected automatically.
     # Lot >= min_notional && Lot <= balance_allowance
     # Expressed in quote asset
-    lot = models.FloatField(null=True, blank=True, default=None)
+    lot = FixedPointField(null=True, blank=True, default=None)
 
     # Setting, coefficient by which each subsequent lot size is multiplied in descending series.
     lot_multiplier_down = models.FloatField(default=1)
@@ -230,16 +233,28 @@ class Order(models.Model):
 
     side = EnumField(choices=Sides.choices, null=True, blank=True, default=None)
 
-    quote_quantity = models.FloatField(null=True, blank=True, default=None)
-    quantity = models.FloatField(null=True, blank=True, default=None)
-    price = models.FloatField(null=True, blank=True, default=None)
-    stop_price = models.FloatField(null=True, blank=True, default=None)
+    quote_quantity = FixedPointField(null=True, blank=True, default=None)
+    quantity = FixedPointField(null=True, blank=True, default=None)
+    price = FixedPointField(null=True, blank=True, default=None)
+    stop_price = FixedPointField(null=True, blank=True, default=None)
     callback = models.TextField(default="")
     position_key = models.CharField(max_length=128, null=True, blank=True, default=None)
 
+    # Denormalized position.round.bot and its exchange_connection, look fill_order_owners()
+    bot = models.ForeignKey(Bot, on_delete=models.CASCADE, null=True, blank=True, default=None)
+    exchange_connection = models.ForeignKey(
+        ExchangeConnection,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        default=None
+    )
+
     class Meta:
         index_together = [
             ['position', 'position_key'],
+            ['bot', 'status'],
+            ['exchange_connection', 'status'],
         ]
 
     class CallbackStatuses(models.TextChoices):
@@ -253,7 +268,157 @@ class Order(models.Model):
     callback_status = EnumField(choices=CallbackStatuses.choices, default=CallbackStatuses.WAITING)
     callback_at = models.DateTimeField(auto_now=False, null=True, blank=True, default=None)
 
-    result_quote_asset_quantity = models.FloatField(null=True, blank=True, default=None)
+    result_quote_asset_quantity = FixedPointField(null=True, blank=True, default=None)
     oco_order = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, default=None)
 
-    result_filled_quantity = models.FloatField(null=True, blank=True, default=None)
+    result_filled_quantity = FixedPointField(null=True, blank=True, default=None)
+
+
+def fill_order_owners(orders: list[Order]):
+    """
+    Sets denormalized bot and exchange_connection of orders by their positions, with one query.
+    Orders with both of them set and orders with loaded position and round don't need the query
+    """
+    for order in orders:
+        if order.bot_id is None and Order.position.is_cached(order) and Position.round.is_cached(order.position):
+            order.bot_id = order.position.round.bot_id
+    position_ids = {
+        order.position_id for order in orders if order.bot_id is None or order.exchange_connection_id is None
+    }
+    if not position_ids:
+        return
+    owners = {
+        position_id: (bot_id, exchange_connection_id)
+        for position_id, bot_id, exchange_connection_id in Position.objects.filter(id__in=position_ids).values_list(
+            'id',
+            'round__bot_id',
+            'round__bot__exchange_connection_id'
+        )
+    }
+    for order in orders:
+        if order.position_id in owners:
+            bot_id, exchange_connection_id = owners[order.position_id]
+            if order.bot_id is None:
+                order.bot_id = bot_id
+            if order.exchange_connection_id is None:
+                order.exchange_connection_id = exchange_connection_id
+
+
+# noinspection PyUnusedLocal
+@receiver(pre_save, sender=Order)
+def fill_order_owners_on_save(sender, instance, **kwargs):
+    if instance.bot_id is None or instance.exchange_connection_id is None:
+        fill_order_owners([instance])
+
+
+def mark_connections_active(exchange_connection_ids: set):
+    """
+    Must be called, when orders are created
+    """
+    exchange_connection_ids = {_id for _id in exchange_connection_ids if _id is not None}
+    if exchange_connection_ids:
+        ExchangeConnection.objects.filter(id__in=exchange_connection_ids, has_active_orders=False).update(
+            has_active_orders=True
+        )
+
+
+def refresh_connections_active(exchange_connection_ids: set):
+    """
+    Must be called, when orders leave NEW or ACTIVE status
+    """
+    exchange_connection_ids = {_id for _id in exchange_connection_ids if _id is not None}
+    if not exchange_connection_ids:
+        return
+    active = Order.objects.filter(status__in=[Order.Statuses.NEW, Order.Statuses.ACTIVE])
+    ExchangeConnection.objects.filter(id__in=exchange_connection_ids).update(
+        has_active_orders=models.ExpressionWrapper(
+            models.Q(models.Exists(active.filter(exchange_connection_id=models.OuterRef('id'))))
+            # Orders, created by old code during deployment, don't have denormalized exchange_connection yet
+            | models.Q(models.Exists(active.filter(
+                exchange_connection__isnull=True,
+                position__round__bot__exchange_connection_id=models.OuterRef('id')
+            ))),
+            output_field=models.BooleanField()
+        )
+    )
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=Order)
+def mark_connection_active_on_create(sender, instance, created, **kwargs):
+    if created:
+        mark_connections_active({instance.exchange_connection_id})
+
+
+class OrderSyncCursor(models.Model):
+    """
+    Position of history sync of exchange orders of the connection and symbol:
+    orders with exchange id less than last_order_id are not requested again, active of them are refreshed separately
+    """
+    exchange_connection = models.ForeignKey(ExchangeConnection, on_delete=models.CASCADE)
+    symbol = models.CharField(max_length=32)
+    last_order_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['exchange_connection', 'symbol'], name='exchange_connection_and_symbol')
+        ]
+
+
+class OrderArchive(models.Model):
+    """
+    Orders of finished rounds, moved from Order by order_archive command.
+
+    The table is partitioned by month of created_at and is created by migration 0030 (primary key is (id, created_at),
+    there are no foreign keys), so the model isn't managed by migrations. Look services.get_orders_history()
+    """
+    id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+    position_id = models.BigIntegerField()
+    bot_id = models.BigIntegerField(null=True)
+    exchange_connection_id = models.BigIntegerField(null=True)
+    oco_order_id = models.BigIntegerField(null=True)
+    status = models.CharField(max_length=32)
+    type = models.CharField(max_length=32, null=True)
+    side = models.CharField(max_length=32, null=True)
+    quote_quantity = FixedPointField(null=True)
+    quantity = FixedPointField(null=True)
+    price = FixedPointField(null=True)
+    stop_price = FixedPointField(null=True)
+    callback = models.TextField()
+    position_key = models.CharField(max_length=128, null=True)
+    callback_status = models.CharField(max_length=32)
+    callback_at = models.DateTimeField(null=True)
+    result_quote_asset_quantity = FixedPointField(null=True)
+    result_filled_quantity = FixedPointField(null=True)
+
+    # Columns, copied from Order
+    ORDER_FIELDS = (
+        'id',
+        'created_at',
+        'updated_at',
+        'position_id',
+        'bot_id',
+        'exchange_connection_id',
+        'oco_order_id',
+        'status',
+        'type',
+        'side',
+        'quote_quantity',
+        'quantity',
+        'price',
+        'stop_price',
+        'callback',
+        'position_key',
+        'callback_status',
+        'callback_at',
+        'result_quote_asset_quantity',
+        'result_filled_quantity',
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'tbot_orderarchive'
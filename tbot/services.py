@@ -2,9 +2,11 @@ from django.utils import timezone
 import traceback
 import sys
 from datetime import datetime
+from django.conf import settings
 from .exchanges import Exchange
-from .models import ExchangeConnection, Bot, Order, Position
+from .models import ExchangeConnection, Bot, Order, OrderArchive
 from .algorithms import Algorithm
+from .dto import OrderCallbackJob
 
 
 def get_exchange(exchange_connection: ExchangeConnection) -> Exchange:
@@ -15,18 +17,76 @@ def get_bots_by_connection_id(exchange_connection_id):
     return Bot.objects.filter(exchange_connection_id=exchange_connection_id).all()
 
 
+def get_active_symbols(exchange_connection_id) -> list[str]:
+    return list(
+        Bot.objects.filter(exchange_connection_id=exchange_connection_id, status=Bot.Statuses.ON)
+        .values_list('symbol__symbol', flat=True)
+        .distinct()
+    )
+
+
+def get_price_symbols(exchanges: list[str]) -> list[str]:
+    """
+    Symbols of working bots of exchanges, their prices are published by price_streams.py
+    """
+    return list(
+        Bot.objects.filter(exchange_connection__exchange__in=exchanges, status=Bot.Statuses.ON)
+        .values_list('symbol__symbol', flat=True)
+        .distinct()
+    )
+
+
 def get_exchange_connection(id):
     return ExchangeConnection.objects.get(id=id)
 
 
 def get_active_exchange_connections():
-    return ExchangeConnection.objects.filter(
-        bot__round__position__in=Position.objects.filter(order__status__in=[Order.Statuses.ACTIVE, Order.Statuses.NEW])
-    ).distinct()
+    return ExchangeConnection.objects.filter(has_active_orders=True)
 
 
 def get_active_orders(bot_id=id):
-    return Order.objects.filter(position__round__bot_id=bot_id, status=Order.Statuses.ACTIVE)
+    return Order.objects.filter(bot_id=bot_id, status=Order.Statuses.ACTIVE)
+
+
+def get_orders_history(
+        bot_id: int = None,
+        exchange_connection_id: int = None,
+        created_from: datetime = None,
+        created_to: datetime = None
+):
+    """
+    Orders and archived orders (look order_archive command) as dicts of OrderArchive.ORDER_FIELDS, ordered by
+    created_at. Filters by created_at allow MySQL to read only needed partitions of the archive.
+    """
+    filters = {}
+    if bot_id is not None:
+        filters['bot_id'] = bot_id
+    if exchange_connection_id is not None:
+        filters['exchange_connection_id'] = exchange_connection_id
+    if created_from is not None:
+        filters['created_at__gte'] = created_from
+    if created_to is not None:
+        filters['created_at__lt'] = created_to
+
+    orders = Order.objects.filter(**filters).values(*OrderArchive.ORDER_FIELDS)
+    archived = OrderArchive.objects.filter(**filters).values(*OrderArchive.ORDER_FIELDS)
+    return orders.union(archived, all=True).order_by('created_at', 'id')
+
+
+def order_callback_shard_queue(shard: int) -> str:
+    return settings.RABBITMQ_ORDER_CALLBACK_QUEUE + '-' + str(shard)
+
+
+def order_callback_queue(bot_id: int) -> str:
+    # Callbacks of one bot always go to the same queue, so they are executed in order
+    return order_callback_shard_queue(shard=bot_id % settings.ORDER_CALLBACKS_SHARDS)
+
+
+def execute_order_callback_job(job: OrderCallbackJob):
+    order = Order.objects.select_related('position__round__bot', 'oco_order').filter(id=job.order_id).first()
+    if order is None or order.position.round.bot.status != Bot.Statuses.ON:
+        return
+    execute_order_callback(order=order)
 
 
 def execute_order_callback(order: Order):
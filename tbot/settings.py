@@ -169,6 +169,58 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 RABBITMQ_HOST = 'rabbitmq'
 RABBITMQ_USER_DS_CMD_QUEUE = 'user-data-streams-cmd'
+# Commands of user data streams are processed by threads (commands of one connection - in order)
+RABBITMQ_USER_DS_CMD_PREFETCH = 100
+RABBITMQ_USER_DS_CMD_WORKERS = 4
+
+# Algorithm callbacks of orders are executed by order_callbacks.py, jobs are sent to queues by bot id
+# (prefix + '-' + shard). Every queue has single active consumer, so callbacks of one bot are executed in order.
+# If ORDER_CALLBACKS_QUEUE is False, callbacks are executed by the process, received order update
+ORDER_CALLBACKS_QUEUE = True
+ORDER_CALLBACKS_SHARDS = 8
+ORDER_CALLBACKS_PREFETCH = 50
+ORDER_CALLBACKS_WORKERS = 4
+RABBITMQ_ORDER_CALLBACK_QUEUE = 'order-callbacks'
+RABBITMQ_ORDER_CALLBACK_QUEUE_ARGUMENTS = {'x-single-active-consumer': True}
+# Attempts to publish message again with new connection after connection or channel errors
+RABBITMQ_PUBLISH_RETRIES = 2
+# Callback of consumed message is retried after RABBITMQ_RETRY_DELAY seconds, if it fails,
+# and the message is rejected after RABBITMQ_RETRIES failed retries
+RABBITMQ_RETRIES = 5
+RABBITMQ_RETRY_DELAY = 2
+# Codec of published messages: 'struct' (registered DTOs, look lib/codec.py) or 'pickle'.
+# Consumers decode both
+RABBITMQ_CODEC = 'struct'
+
+# Number of worker processes of user_data_streams.py, every worker serves many connections in one event loop.
+# 0 - separate process for every connection
+USER_DATA_STREAMS_WORKERS = 0
+
+# Order status updates of user data stream are written by batches, collected during the window (seconds).
+# Algorithm callbacks are distributed after that by bot to lanes (bounded queues),
+# every lane is processed in order by threads, shared by all streams of the process
+USER_DATA_STREAM_BATCH_WINDOW = 0.02
+USER_DATA_STREAM_BATCH_SIZE = 500
+USER_DATA_STREAM_LANES = 4
+USER_DATA_STREAM_QUEUE_SIZE = 10000
+USER_DATA_STREAM_DB_THREADS = 8
+
+# User socket is replaced by new one every interval (seconds), both sockets are listened during overlap
+USER_DATA_STREAM_ROTATE_INTERVAL = 23 * 60 * 60
+USER_DATA_STREAM_ROTATE_OVERLAP = 5
 
 EXCHANGE_ORDER_PREFIX = '7c071b84444e'
 
+# Max number of simultaneous requests to exchange, sent by Exchange.new_orders_batch
+EXCHANGE_BATCH_CONCURRENCY = 10
+
+# https://binance-docs.github.io/apidocs/spot/en/#limits
+# Request weight per minute and orders per 10 seconds, allowed for one connection
+BINANCE_REQUEST_WEIGHT_LIMIT = 1200
+BINANCE_ORDER_COUNT_LIMIT = 50
+# How many times request, rejected with 429 (too many requests), is repeated after Retry-After
+BINANCE_REQUEST_RETRIES = 3
+
+# Prices, published by price_streams.py, older than this (seconds) are requested by REST
+PRICE_CACHE_MAX_AGE = 10
+
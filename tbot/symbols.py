@@ -0,0 +1,187 @@
+import threading
+import time
+import uuid
+from decimal import Decimal, ROUND_HALF_EVEN
+from django.core.cache import cache
+from db.fields import to_decimal
+from .models import Symbol
+
+
+class Precision:
+    """
+    Tick (price), step (quantity) and their product (quote quantity) of symbol as integers in units of
+    1 / factor, every of them has own factor by its number of decimal places.
+
+    Values are rounded to the nearest multiple (half to even) in Decimal and integer arithmetic,
+    so results are exactly on the grid and are converted to the nearest float once.
+    """
+    __slots__ = ('tick_factor', 'tick', 'step_factor', 'step', 'quote_factor', 'quote_step')
+
+    # Array rounding is exact only while scaled values are integers, representable by float64
+    MAX_EXACT = 2 ** 53
+
+    @staticmethod
+    def _grid(size: Decimal) -> tuple[int, int]:
+        exponent = size.normalize().as_tuple().exponent
+        factor = 10 ** max(0, -exponent)
+        return factor, int(size * factor)
+
+    def __init__(self, tick_size: Decimal | float, step_size: Decimal | float):
+        tick = to_decimal(tick_size)
+        step = to_decimal(step_size)
+        self.tick_factor, self.tick = self._grid(tick)
+        self.step_factor, self.step = self._grid(step)
+        self.quote_factor, self.quote_step = self._grid(tick * step)
+
+    @staticmethod
+    def _round(value: Decimal | float, factor: int, units: int) -> float:
+        n = int((to_decimal(value) * factor / units).to_integral_value(rounding=ROUND_HALF_EVEN))
+        # Division of integers is correctly rounded to the nearest float
+        return n * units / factor
+
+    def round_price(self, price: float) -> float:
+        return self._round(value=price, factor=self.tick_factor, units=self.tick)
+
+    def round_lot(self, quantity: float) -> float:
+        return self._round(value=quantity, factor=self.step_factor, units=self.step)
+
+    def round_quote_qty(self, quote_quantity: float) -> float:
+        return self._round(value=quote_quantity, factor=self.quote_factor, units=self.quote_step)
+
+    def _round_array(self, values, factor: int, units: int):
+        import numpy
+        values = numpy.asarray(values, dtype=numpy.float64)
+        scaled = values * factor
+        if not numpy.all(numpy.abs(scaled) < self.MAX_EXACT):
+            # Scaled values don't fit int64 exactly, every value is rounded in Decimal
+            return numpy.array([self._round(value=float(value), factor=factor, units=units) for value in values])
+        # Rounded once to the multiple of units, as _round() does
+        q = scaled / units
+        result = numpy.rint(q) * units / factor
+        # Float error of q can move exact halves of units to either side, values near halves are rounded in Decimal
+        halves = numpy.flatnonzero(numpy.abs(numpy.abs(q - numpy.floor(q)) - 0.5) <= numpy.abs(q) * 1e-12 + 1e-12)
+        for i in halves:
+            result[i] = self._round(value=float(values[i]), factor=factor, units=units)
+        return result
+
+    def round_prices(self, prices):
+        """
+        Rounds array of prices by one call, returns numpy array
+        """
+        return self._round_array(values=prices, factor=self.tick_factor, units=self.tick)
+
+    def round_lots(self, quantities):
+        return self._round_array(values=quantities, factor=self.step_factor, units=self.step)
+
+
+class SymbolInfo:
+    """
+    Read-only copy of Symbol row, kept by SymbolRegistry
+    """
+    FIELDS = (
+        'id',
+        'exchange',
+        'symbol',
+        'base_asset',
+        'quote_asset',
+        'min_notional',
+        'min_price',
+        'max_price',
+        'tick_size',
+        'step_size',
+        'min_qty',
+        'enabled',
+    )
+    __slots__ = FIELDS + ('_precision',)
+
+    def __init__(self, **kwargs):
+        for name in self.FIELDS:
+            setattr(self, name, kwargs.get(name))
+        self._precision = None
+
+    @property
+    def precision(self) -> Precision:
+        if self._precision is None:
+            self._precision = Precision(tick_size=self.tick_size, step_size=self.step_size)
+        return self._precision
+
+
+class SymbolRegistry:
+    """
+    Symbols of exchanges, shared by all code of the process.
+
+    Enabled symbols of exchange are loaded by one query on the first access. Other symbols are loaded one by one,
+    when they are requested. The registry is reloaded, when version stamp in cache is changed by bump_version()
+    (binance_symbols_load does it), version is checked not often than VERSION_CHECK_INTERVAL seconds.
+    """
+    VERSION_CHECK_INTERVAL = 10
+
+    _symbols: dict[str, dict[str, SymbolInfo]] = {}
+    _versions: dict[str, str | None] = {}
+    _checked_at: dict[str, float] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def version_key(exchange: str) -> str:
+        return 'symbols_version_' + exchange
+
+    @classmethod
+    def bump_version(cls, exchange: str):
+        cache.set(cls.version_key(exchange), uuid.uuid4().hex, None)
+        cls.invalidate(exchange=exchange)
+
+    @classmethod
+    def invalidate(cls, exchange: str):
+        with cls._lock:
+            cls._symbols.pop(exchange, None)
+            cls._checked_at.pop(exchange, None)
+
+    @staticmethod
+    def _info(symbol: Symbol) -> SymbolInfo:
+        return SymbolInfo(**{name: getattr(symbol, name) for name in SymbolInfo.FIELDS})
+
+    @classmethod
+    def preload(cls, exchange: str) -> dict[str, SymbolInfo]:
+        version = cache.get(cls.version_key(exchange))
+        symbols = {
+            symbol.symbol: cls._info(symbol)
+            for symbol in Symbol.objects.filter(exchange=exchange, enabled=True)
+        }
+        with cls._lock:
+            cls._symbols[exchange] = symbols
+            cls._versions[exchange] = version
+            cls._checked_at[exchange] = time.monotonic()
+        return symbols
+
+    @classmethod
+    def _fresh(cls, exchange: str) -> bool:
+        checked_at = cls._checked_at.get(exchange)
+        return checked_at is not None and time.monotonic() - checked_at < cls.VERSION_CHECK_INTERVAL
+
+    @classmethod
+    def get_loaded(cls, exchange: str, symbol: str) -> SymbolInfo | None:
+        """
+        Returns symbol without any I/O, or None if it is not loaded or version should be checked
+        """
+        if not cls._fresh(exchange):
+            return None
+        return cls._symbols.get(exchange, {}).get(symbol)
+
+    @classmethod
+    def get(cls, exchange: str, symbol: str) -> SymbolInfo:
+        """
+        Raises Symbol.DoesNotExist, if there is no such symbol
+        """
+        symbols = cls._symbols.get(exchange) if cls._fresh(exchange) else None
+        if symbols is None:
+            symbols = cls._symbols.get(exchange)
+            if symbols is not None and cache.get(cls.version_key(exchange)) == cls._versions.get(exchange):
+                cls._checked_at[exchange] = time.monotonic()
+            else:
+                symbols = cls.preload(exchange=exchange)
+
+        info = symbols.get(symbol)
+        if info is None:
+            info = cls._info(Symbol.objects.get(exchange=exchange, symbol=symbol))
+            symbols[symbol] = info
+        return info
@@ -0,0 +1,32 @@
+from decimal import Decimal
+from django.test import SimpleTestCase
+from tbot.symbols import Precision
+
+
+class PrecisionTest(SimpleTestCase):
+    VALUES = [0.011, 0.029, 0.03, 0.031, 0.049, 0.05, 0.075, 0.125, 0.2, 1.2345, 17.03, 99.99, 146.33, 268.335, 12345.678]
+
+    def assert_array_matches_scalar(self, tick_size: str, step_size: str):
+        precision = Precision(tick_size=Decimal(tick_size), step_size=Decimal(step_size))
+        self.assertEqual(
+            list(precision.round_prices(self.VALUES)),
+            [precision.round_price(value) for value in self.VALUES]
+        )
+        self.assertEqual(
+            list(precision.round_lots(self.VALUES)),
+            [precision.round_lot(value) for value in self.VALUES]
+        )
+
+    def test_array_matches_scalar(self):
+        for tick_size, step_size in [
+            ('0.02', '0.05'),
+            ('0.25', '0.5'),
+            ('0.01', '0.001'),
+            ('5', '0.2'),
+        ]:
+            with self.subTest(tick_size=tick_size, step_size=step_size):
+                self.assert_array_matches_scalar(tick_size=tick_size, step_size=step_size)
+
+    def test_round_prices(self):
+        precision = Precision(tick_size=Decimal('0.02'), step_size=Decimal('0.01'))
+        self.assertEqual(list(precision.round_prices([0.029, 0.031, 0.049, 0.011])), [0.02, 0.04, 0.04, 0.02])
@@ -1,11 +1,12 @@
 #!/usr/bin/env python
 import os
+import asyncio
 import django
 from lib import rabbitmq, catch_and_print_exceptions
 import procname
 import time
-from multiprocessing import Process  # , current_process
-from threading import Thread
+from multiprocessing import Process, Queue  # , current_process
+from threading import Thread, Lock
 from tbot.dto import *
 
 # import sys
@@ -15,7 +16,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tbot.settings')
 
 def main():
     from django.conf import settings
+    from django.db import connections
     from tbot import services
+    from tbot.exchanges.exchanges import Exchange
 
     # def sync_history(exchange_connection_id):
     #     connection = services.get_exchange_connection(id=exchange_connection_id)
@@ -54,6 +57,107 @@ def main():
 
     _processes = {}
 
+    # Worker pool mode: every worker process serves many connections in one event loop
+    async def pool_worker(commands: Queue):
+        from asgiref.sync import sync_to_async
+        loop = asyncio.get_running_loop()
+        streams = {}
+
+        def start(exchange_connection_id):
+            connection = services.get_exchange_connection(id=exchange_connection_id)
+            return services.get_exchange(exchange_connection=connection)
+
+        async def restart(exchange_connection_id, stream):
+            await asyncio.sleep(1)
+            if streams.get(exchange_connection_id) is stream:
+                print("RESTART: " + str(exchange_connection_id))
+                del streams[exchange_connection_id]
+                await command(ExchangeConnectionWorkerCommand(
+                    exchange_connection_id=exchange_connection_id,
+                    command=ExchangeConnectionWorkerCommands.START
+                ))
+
+        @catch_and_print_exceptions()
+        def on_stop(stream):
+            for _exchange_connection_id, _stream in streams.items():
+                if _stream is stream:
+                    loop.create_task(restart(_exchange_connection_id, stream))
+
+        async def command(body: ExchangeConnectionWorkerCommand):
+            if body.command == ExchangeConnectionWorkerCommands.START:
+                if body.exchange_connection_id not in streams:
+                    print("START: " + str(body.exchange_connection_id))
+                    exchange = await sync_to_async(start, thread_sensitive=True)(body.exchange_connection_id)
+                    streams[body.exchange_connection_id] = exchange.user_data_stream_attach(loop=loop, on_stop=on_stop)
+
+            if body.command == ExchangeConnectionWorkerCommands.STOP:
+                stream = streams.pop(body.exchange_connection_id, None)
+                if stream is not None:
+                    print("STOP: " + str(body.exchange_connection_id))
+                    stream.stop()
+
+        while True:
+            body = await loop.run_in_executor(None, commands.get)
+            try:
+                await command(body)
+            except BaseException as e:
+                print("ERROR: " + str(body.exchange_connection_id) + ": " + str(e))
+
+    def pool_worker_function(index, commands: Queue):
+        procname.setprocname("w-" + str(index))
+        asyncio.run(pool_worker(commands))
+
+    class PoolWorker(Thread):
+        def __init__(self, index):
+            Thread.__init__(self)
+            self.index = index
+            self.commands = Queue()
+            self.exchange_connection_ids = set()
+
+        def send(self, exchange_connection_id, command):
+            self.commands.put(ExchangeConnectionWorkerCommand(
+                exchange_connection_id=exchange_connection_id,
+                command=command
+            ))
+
+        def run(self):
+            while True:
+                process = Process(target=pool_worker_function, args=(self.index, self.commands))
+                process.daemon = True
+                process.start()
+                process.join()
+                print("RESTART WORKER: " + str(self.index))
+                for _exchange_connection_id in list(self.exchange_connection_ids):
+                    self.send(_exchange_connection_id, ExchangeConnectionWorkerCommands.START)
+
+    _pool = [PoolWorker(index=i) for i in range(settings.USER_DATA_STREAMS_WORKERS)]
+
+    # Commands of different connections are received by many threads
+    _pool_lock = Lock()
+
+    def pool_assign(exchange_connection_id) -> PoolWorker:
+        for worker in _pool:
+            if exchange_connection_id in worker.exchange_connection_ids:
+                return worker
+        # Shard by id, unless the shard is noticeably more loaded than the least loaded worker
+        worker = _pool[hash(exchange_connection_id) % len(_pool)]
+        least_loaded = min(_pool, key=lambda w: len(w.exchange_connection_ids))
+        if len(worker.exchange_connection_ids) > len(least_loaded.exchange_connection_ids) + 1:
+            worker = least_loaded
+        worker.exchange_connection_ids.add(exchange_connection_id)
+        return worker
+
+    def pool_command_received(channel, method, properties, body: ExchangeConnectionWorkerCommand):
+        with _pool_lock:
+            if body.command == ExchangeConnectionWorkerCommands.START:
+                pool_assign(body.exchange_connection_id).send(body.exchange_connection_id, body.command)
+
+            if body.command == ExchangeConnectionWorkerCommands.STOP:
+                for worker in _pool:
+                    if body.exchange_connection_id in worker.exchange_connection_ids:
+                        worker.exchange_connection_ids.remove(body.exchange_connection_id)
+                        worker.send(body.exchange_connection_id, body.command)
+
     def command_received(channel, method, properties, body: ExchangeConnectionWorkerCommand):
         if body.command == ExchangeConnectionWorkerCommands.START:
             if body.exchange_connection_id not in _processes or \
@@ -72,6 +176,9 @@ def main():
     def exception_handler():
         print('Emergency termination in 3 seconds')
         time.sleep(3)
+        if _pool:
+            # Worker processes are daemons and will be terminated with the main process
+            return
         for _exchange_connection_id in _processes:
             print("TERMINATE: " + str(_exchange_connection_id))
             worker = _processes[_exchange_connection_id]
@@ -80,11 +187,28 @@ def main():
 
     @catch_and_print_exceptions(callback_after=exception_handler, exit_after=True)
     def run():
-        for exchange_connection in services.get_active_exchange_connections():
-            _exchange = services.get_exchange(exchange_connection=exchange_connection)
-            _exchange.user_data_stream_start()
-
-        rabbitmq.listen(queue=settings.RABBITMQ_USER_DS_CMD_QUEUE, callback=command_received)
+        Exchange.user_data_streams_command(
+            exchanges=[
+                services.get_exchange(exchange_connection=exchange_connection)
+                for exchange_connection in services.get_active_exchange_connections()
+            ],
+            command=ExchangeConnectionWorkerCommands.START
+        )
+
+        # Child processes are forked by workers, they shouldn't inherit DB connection of this process
+        connections.close_all()
+
+        for worker in _pool:
+            worker.daemon = True
+            worker.start()
+
+        rabbitmq.listen(
+            queue=settings.RABBITMQ_USER_DS_CMD_QUEUE,
+            callback=pool_command_received if _pool else command_received,
+            prefetch_count=settings.RABBITMQ_USER_DS_CMD_PREFETCH,
+            workers=settings.RABBITMQ_USER_DS_CMD_WORKERS,
+            key_func=lambda body: body.exchange_connection_id
+        )
 
     run()
 